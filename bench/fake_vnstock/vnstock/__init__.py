@@ -0,0 +1,112 @@
+"""vnstock giả lập cho benchmark: cùng giao diện Quote / Finance / Trading mà server.py dùng,
+dữ liệu tất định theo mã và độ trễ cấu hình qua biến môi trường.
+
+    FAKE_VNSTOCK_LATENCY   độ trễ mỗi lần gọi (giây, mặc định 0.2)
+    FAKE_VNSTOCK_JITTER    dao động ngẫu nhiên cộng thêm (giây, mặc định 0.05)
+    FAKE_VNSTOCK_ERROR     tỉ lệ lỗi giả lập (0..1, mặc định 0)
+    FAKE_VNSTOCK_IMPORT    thời gian import giả lập (giây, mặc định 0), vnstock thật mất vài giây
+"""
+import os
+import random
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+LATENCY = float(os.environ.get('FAKE_VNSTOCK_LATENCY', 0.2))
+JITTER = float(os.environ.get('FAKE_VNSTOCK_JITTER', 0.05))
+ERROR_RATE = float(os.environ.get('FAKE_VNSTOCK_ERROR', 0))
+
+time.sleep(float(os.environ.get('FAKE_VNSTOCK_IMPORT', 0)))
+
+# Ngày giao dịch theo giờ Việt Nam như vnstock thật, không theo múi giờ của máy chạy bench
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def _last_session():
+    # Trước giờ mở cửa (9:00) phiên hôm nay chưa có
+    now = datetime.now(VN_TZ)
+    return now.date() if now.hour >= 9 else now.date() - timedelta(days=1)
+
+
+def _call():
+    time.sleep(LATENCY + random.uniform(0, JITTER))
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        raise ConnectionError('fake vnstock: lỗi giả lập')
+
+
+def _closes(symbol, days):
+    # Giá theo ngày tất định: cùng mã + cùng ngày luôn ra cùng giá
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    base = 20 + rng.random() * 80
+    ordinal = np.array([d.toordinal() for d in days], dtype=np.int64)
+    noise = np.sin(ordinal * 0.37 + rng.random() * 6) * 0.03 + np.cos(ordinal * 0.11) * 0.05
+    return np.round(base * (1 + noise), 2)
+
+
+class Quote:
+    def __init__(self, symbol, source='VCI'):
+        self.symbol = symbol.upper()
+
+    def history(self, count_back=None, start=None, end=None, interval='1D'):
+        _call()
+        last = _last_session()
+        if count_back:
+            days = pd.bdate_range(end=last, periods=count_back)
+        else:
+            end = min(pd.Timestamp(end).date(), last) if end else last
+            days = pd.bdate_range(start=start, end=end)
+        close = _closes(self.symbol, days)
+        return pd.DataFrame({
+            'time': days,
+            'open': np.round(close * 0.995, 2),
+            'high': np.round(close * 1.01, 2),
+            'low': np.round(close * 0.99, 2),
+            'close': close,
+            'volume': (close * 10000).astype(np.int64),
+        })
+
+
+class Finance:
+    def __init__(self, symbol, source='VCI'):
+        self.symbol = symbol.upper()
+
+    def ratio(self, period='year'):
+        _call()
+        seed = zlib.crc32(self.symbol.encode())
+        rows = []
+        this_year = datetime.now(VN_TZ).year
+        for i, year in enumerate(range(this_year - 5, this_year)):
+            k = 1 + ((seed >> i) % 7) / 20
+            rows.append([year, 12.5 * k, 1.8 * k, 0.15 * k, 50000 * k, 3000 * k])
+        columns = pd.MultiIndex.from_tuples([
+            ('Meta', 'Năm'),
+            ('Chỉ tiêu định giá', 'P/E'),
+            ('Chỉ tiêu định giá', 'P/B'),
+            ('Chỉ tiêu hiệu quả hoạt động', 'ROE'),
+            ('Chỉ tiêu định giá', 'Market Capital (Bn. VND)'),
+            ('Chỉ tiêu định giá', 'EPS (VND)'),
+        ])
+        return pd.DataFrame(rows, columns=columns)
+
+
+class Trading:
+    def __init__(self, source='VCI'):
+        pass
+
+    def price_board(self, symbols_list):
+        _call()
+        today = _last_session()
+        days = [today - timedelta(days=1), today]
+        rows = []
+        for s in symbols_list:
+            ref, price = _closes(s.upper(), days)
+            rows.append([s.upper(), ref * 1000, price * 1000])
+        columns = pd.MultiIndex.from_tuples([
+            ('listing', 'symbol'),
+            ('listing', 'ref_price'),
+            ('match', 'match_price'),
+        ])
+        return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,275 @@
+"""Server giả lập endpoint youtubei/v1/search, phát lại các file JSON trong bench/payloads/.
+
+bench/payloads/synthetic_search.json là payload TỔNG HỢP do synthetic_payload() sinh ra (không có
+mạng để ghi response thật); có thể thả thêm response youtubei thật (đã cắt bớt) vào cùng thư mục.
+Sinh lại:  python3 bench/fake_youtube.py --write-synthetic
+
+Chạy riêng:  python3 bench/fake_youtube.py --port 9001 --latency 0.3
+rồi trỏ server chính sang:  YT_BASE_URL=http://127.0.0.1:9001 python3 server.py
+"""
+import argparse
+import base64
+import glob
+import gzip
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads')
+
+
+def _token(rng, size):
+    # Chuỗi base64 ngẫu nhiên giống trackingParams / clickTrackingParams của youtubei
+    return base64.urlsafe_b64encode(rng.randbytes(size)).decode().rstrip('=')
+
+
+def _runs(text, rng, browse_id=None):
+    run = {'text': text}
+    if browse_id:
+        run['navigationEndpoint'] = {
+            'clickTrackingParams': _token(rng, 36),
+            'commandMetadata': {'webCommandMetadata': {
+                'url': f'/@{browse_id}', 'webPageType': 'WEB_PAGE_TYPE_CHANNEL', 'rootVe': 3611, 'apiUrl': '/youtubei/v1/browse'}},
+            'browseEndpoint': {'browseId': browse_id, 'canonicalBaseUrl': f'/@{browse_id}'},
+        }
+    return {'runs': [run]}
+
+
+def _thumbnails(video_id, rng):
+    return {'thumbnails': [
+        {'url': f'https://i.ytimg.com/vi/{video_id}/hq720.jpg?sqp=-{_token(rng, 48)}&rs={_token(rng, 24)}',
+         'width': w, 'height': h} for w, h in ((360, 202), (720, 404))]}
+
+
+def _menu(rng, video_id):
+    items = []
+    for icon, text in (('ADD_TO_QUEUE_TAIL', 'Thêm vào danh sách chờ'), ('WATCH_LATER', 'Lưu vào Xem sau'),
+                       ('PLAYLIST_ADD', 'Lưu vào danh sách phát'), ('SHARE', 'Chia sẻ'),
+                       ('NOT_INTERESTED', 'Không quan tâm'), ('FLAG', 'Báo cáo')):
+        items.append({'menuServiceItemRenderer': {
+            'text': {'runs': [{'text': text}]}, 'icon': {'iconType': icon},
+            'serviceEndpoint': {'clickTrackingParams': _token(rng, 36),
+                                'commandMetadata': {'webCommandMetadata': {'sendPost': True}},
+                                'signalServiceEndpoint': {'signal': 'CLIENT_SIGNAL', 'actions': [{
+                                    'clickTrackingParams': _token(rng, 36),
+                                    'addToPlaylistCommand': {'openMiniplayer': True, 'videoId': video_id,
+                                                             'listType': 'PLAYLIST_EDIT_LIST_TYPE_QUEUE'}}]}},
+            'trackingParams': _token(rng, 36)}})
+    return {'menuRenderer': {'items': items, 'trackingParams': _token(rng, 36),
+                             'accessibility': {'accessibilityData': {'label': 'Menu tác vụ'}}}}
+
+
+def _video(query, index, seed, rng):
+    video_id = f'{seed:08x}{index:03d}'[:11]
+    channel = f'Kênh {index % 5 + 1}'
+    handle = f'kenh{index % 5 + 1}'
+    title = f'{query} #{index + 1}'
+    minutes, seconds = 2 + index % 20, (index * 7) % 60
+    views = (seed >> (index % 16)) % 5_000_000
+    watch = {
+        'clickTrackingParams': _token(rng, 36),
+        'commandMetadata': {'webCommandMetadata': {
+            'url': f'/watch?v={video_id}&pp={_token(rng, 24)}', 'webPageType': 'WEB_PAGE_TYPE_WATCH', 'rootVe': 3832}},
+        'watchEndpoint': {'videoId': video_id, 'params': _token(rng, 12), 'playerParams': _token(rng, 24),
+                          'watchEndpointSupportedOnesieConfig': {'html5PlaybackOnesieConfig': {'commonConfig': {
+                              'url': f'https://rr3---sn-{_token(rng, 6)}.googlevideo.com/initplayback?source=youtube&'
+                                     f'oeis=1&c=WEB&oad=3200&ovd=3200&oaad=11000&oavd=11000&ocs=700&oewis=1&'
+                                     f'oputc=1&ofpcc=1&msp=1&odepv=1&id={_token(rng, 8)}&ip=0.0.0.0&initcwndbps=1000000'
+                                     f'&mt={1700000000 + index}&oweuc='}}}},
+    }
+    return {'videoRenderer': {
+        'videoId': video_id,
+        'thumbnail': _thumbnails(video_id, rng),
+        'title': {'runs': [{'text': title}], 'accessibility': {'accessibilityData': {
+            'label': f'{title} của {channel} {views} lượt xem {minutes} phút, {seconds} giây'}}},
+        'longBylineText': _runs(channel, rng, handle),
+        'publishedTimeText': {'simpleText': f'{index % 11 + 1} tháng trước'},
+        'lengthText': {'accessibility': {'accessibilityData': {'label': f'{minutes} phút, {seconds} giây'}},
+                       'simpleText': f'{minutes}:{seconds:02d}'},
+        'viewCountText': {'simpleText': f'{views:,} lượt xem'.replace(',', '.')},
+        'navigationEndpoint': watch,
+        'ownerText': _runs(channel, rng, handle),
+        'shortBylineText': _runs(channel, rng, handle),
+        'trackingParams': _token(rng, 48),
+        'showActionMenu': False,
+        'shortViewCountText': {'simpleText': f'{views // 1000} N lượt xem'},
+        'menu': _menu(rng, video_id),
+        'channelThumbnailSupportedRenderers': {'channelThumbnailWithLinkRenderer': {
+            'thumbnail': {'thumbnails': [{'url': f'https://yt3.ggpht.com/{_token(rng, 60)}=s68-c-k-c0x00ffffff-no-rj',
+                                          'width': 68, 'height': 68}]},
+            'navigationEndpoint': _runs(channel, rng, handle)['runs'][0]['navigationEndpoint'],
+            'accessibility': {'accessibilityData': {'label': f'Truy cập kênh {channel}'}}}},
+        'thumbnailOverlays': [
+            {'thumbnailOverlayTimeStatusRenderer': {'text': {'simpleText': f'{minutes}:{seconds:02d}'}, 'style': 'DEFAULT'}},
+            {'thumbnailOverlayToggleButtonRenderer': {
+                'isToggled': False, 'untoggledIcon': {'iconType': 'WATCH_LATER'}, 'toggledIcon': {'iconType': 'CHECK'},
+                'untoggledTooltip': 'Xem sau', 'toggledTooltip': 'Đã thêm',
+                'untoggledServiceEndpoint': {'clickTrackingParams': _token(rng, 36), 'playlistEditEndpoint': {
+                    'playlistId': 'WL', 'actions': [{'addedVideoId': video_id, 'action': 'ACTION_ADD_VIDEO'}]}},
+                'trackingParams': _token(rng, 36)}},
+            {'thumbnailOverlayNowPlayingRenderer': {'text': {'runs': [{'text': 'Đang phát'}]}}},
+            {'thumbnailOverlayLoadingPreviewRenderer': {'text': {'runs': [{'text': 'Tiếp tục nhấn để phát'}]}}},
+        ],
+        'richThumbnail': {'movingThumbnailRenderer': {'movingThumbnailDetails': {'thumbnails': [{
+            'url': f'https://i.ytimg.com/an_webp/{video_id}/mqdefault_6s.webp?du=3000&sqp={_token(rng, 40)}'
+                   f'&rs={_token(rng, 24)}', 'width': 320, 'height': 180}], 'logAsMovingThumbnail': True},
+            'enableHoveredLogging': True, 'enableOverlay': True}},
+        'detailedMetadataSnippets': [{'snippetText': {'runs': [
+            {'text': f'{query} cho bé: tuyển tập bài hát, hoạt hình và câu chuyện vui nhộn giúp bé học mà chơi. '},
+            {'text': query, 'bold': True},
+            {'text': ' — đăng ký kênh để xem video mới mỗi tuần ...'}]},
+            'snippetHoverText': {'runs': [{'text': 'Từ phần mô tả video'}]}, 'maxOneLine': False}],
+        'inlinePlaybackEndpoint': watch,
+        'searchVideoResultEntityKey': _token(rng, 30),
+    }}
+
+
+def _reel_shelf(query, seed, rng):
+    items = []
+    for i in range(10):
+        video_id = f'{seed ^ 0xffff:08x}{i:03d}'[:11]
+        items.append({'reelItemRenderer': {
+            'videoId': video_id,
+            'headline': {'simpleText': f'{query} shorts {i + 1}'},
+            'thumbnail': {'thumbnails': [{'url': f'https://i.ytimg.com/vi/{video_id}/oar2.jpg?sqp={_token(rng, 48)}',
+                                          'width': 405, 'height': 720}]},
+            'viewCountText': {'simpleText': f'{i + 1},{i} Tr lượt xem'},
+            'navigationEndpoint': {'clickTrackingParams': _token(rng, 36), 'reelWatchEndpoint': {
+                'videoId': video_id, 'playerParams': _token(rng, 24), 'params': _token(rng, 60),
+                'sequenceProvider': 'REEL_WATCH_SEQUENCE_PROVIDER_RPC', 'sequenceParams': _token(rng, 80)}},
+            'menu': _menu(rng, video_id),
+            'trackingParams': _token(rng, 48),
+            'style': 'REEL_ITEM_STYLE_AVATAR_CIRCLE'}})
+    return {'reelShelfRenderer': {'title': {'runs': [{'text': 'Shorts'}]}, 'items': items,
+                                  'trackingParams': _token(rng, 36), 'icon': {'iconType': 'YOUTUBE_SHORTS_BRAND_24'}}}
+
+
+def synthetic_payload(query, count=20):
+    """Payload tổng hợp, cùng cấu trúc với youtubei/v1/search (KHÔNG phải bản ghi thật).
+
+    Mô phỏng các phần làm response thật nặng: thumbnail nhiều cỡ, trackingParams, menu,
+    overlay, kệ Shorts, kệ gợi ý và responseContext, ~600 KB (response thật 0.5-1 MB)
+    để đo được chi phí giải nén + json.loads + duyệt cây ở server.
+    """
+    seed = zlib.crc32(query.encode())
+    rng = random.Random(seed)
+    videos = [_video(query, i, seed, rng) for i in range(count)]
+    related = [_video(f'{query} (gợi ý)', i, seed ^ 0xabcdef, rng) for i in range(count)]
+    contents = videos[:3] + [_reel_shelf(query, seed, rng)] + videos[3:8] + [{'shelfRenderer': {
+        'title': {'simpleText': 'Mọi người cũng xem'},
+        'content': {'verticalListRenderer': {'items': related, 'collapsedItemCount': 2,
+                                             'trackingParams': _token(rng, 36)}},
+        'trackingParams': _token(rng, 36)}}] + videos[8:]
+    return {
+        'responseContext': {
+            'serviceTrackingParams': [{'service': name, 'params': [
+                {'key': f'k{i}', 'value': _token(rng, 24)} for i in range(12)]}
+                for name in ('GFEEDBACK', 'CSI', 'GUIDED_HELP', 'ECATCHER')],
+            'mainAppWebResponseContext': {'loggedOut': True, 'trackingParam': _token(rng, 600)},
+            'webResponseContextExtensionData': {'hasDecorated': True},
+        },
+        'estimatedResults': str(1_000_000 + seed % 9_000_000),
+        'contents': {'twoColumnSearchResultsRenderer': {'primaryContents': {'sectionListRenderer': {
+            'contents': [
+                {'itemSectionRenderer': {'contents': contents, 'trackingParams': _token(rng, 36)}},
+                {'continuationItemRenderer': {'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN', 'continuationEndpoint': {
+                    'clickTrackingParams': _token(rng, 36),
+                    'continuationCommand': {'token': _token(rng, 900), 'request': 'CONTINUATION_REQUEST_TYPE_SEARCH'}}}},
+            ],
+            'trackingParams': _token(rng, 36),
+            'subMenu': {'searchSubMenuRenderer': {'trackingParams': _token(rng, 36)}},
+        }}}},
+        'trackingParams': _token(rng, 48),
+        'refinements': [f'{query} {suffix}' for suffix in ('tiếng anh', 'hay nhất', 'mới nhất', 'vui nhộn', 'có lời')],
+        'targetId': 'search-page',
+        'frameworkUpdates': {'entityBatchUpdate': {'mutations': [{
+            'entityKey': _token(rng, 30), 'type': 'ENTITY_MUTATION_TYPE_REPLACE',
+            'payload': {'macroMarkersListEntity': {'key': _token(rng, 30), 'externalVideoId': v['videoRenderer']['videoId'],
+                                                   'markersList': {'markerType': 'MARKER_TYPE_HEATMAP', 'markers': [
+                                                       {'startMillis': str(j * 5000), 'durationMillis': '5000',
+                                                        'intensityScoreNormalized': round(rng.random(), 4)}
+                                                       for j in range(100)]}}}}
+            for v in videos], 'timestamp': {'seconds': '1700000000', 'nanos': 0}}},
+    }
+
+
+def load_payloads(directory=PAYLOAD_DIR):
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    return payloads
+
+
+class FakeYouTubeServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.3, jitter=0.05, payloads=None):
+        super().__init__(address, FakeYouTubeHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.payloads = payloads or []
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class FakeYouTubeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if not self.path.startswith('/youtubei/v1/search'):
+            self.send_error(404)
+            return
+        try:
+            query = json.loads(body).get('query', '')
+        except ValueError:
+            query = ''
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+
+        if self.server.payloads:
+            data = self.server.payloads[zlib.crc32(query.encode()) % len(self.server.payloads)]
+        else:
+            data = json.dumps(synthetic_payload(query)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, 5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, latency=0.3, jitter=0.05, directory=PAYLOAD_DIR):
+    """Chạy server giả lập trong thread nền, trả về server (cổng thật ở server.server_port)."""
+    server = FakeYouTubeServer(('127.0.0.1', port), latency, jitter, load_payloads(directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=9001)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--payloads', default=PAYLOAD_DIR)
+    parser.add_argument('--write-synthetic', action='store_true', help='ghi lại payloads/synthetic_search.json rồi thoát')
+    args = parser.parse_args()
+    if args.write_synthetic:
+        with open(os.path.join(PAYLOAD_DIR, 'synthetic_search.json'), 'w', encoding='utf-8') as f:
+            json.dump(synthetic_payload('nhạc thiếu nhi'), f, ensure_ascii=False, separators=(',', ':'))
+        raise SystemExit
+    server = FakeYouTubeServer(('127.0.0.1', args.port), args.latency, args.jitter, load_payloads(args.payloads))
+    print(f'Fake YouTube search trên http://127.0.0.1:{args.port} ({len(server.payloads)} payload)')
+    server.serve_forever()
@@ -0,0 +1,268 @@
+"""Đo tải server.py với upstream giả lập, không cần mạng.
+
+Khởi động fake YouTube (bench/fake_youtube.py) và server.py với vnstock giả lập
+(bench/fake_vnstock) trên PYTHONPATH, sau đó bắn tải trộn static + API ở mức song song
+cấu hình được và in throughput cùng p50/p95/p99 theo từng route.
+
+    python3 bench/run_bench.py --concurrency 32 --duration 20
+    python3 bench/run_bench.py --mix static=1 --env SERVER_MODE=single
+    python3 bench/run_bench.py --json before.json
+    python3 bench/run_bench.py --baseline before.json
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import fake_youtube
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+TICKERS = ['VIC', 'VHM', 'VNM', 'FPT', 'HPG', 'MWG', 'VCB', 'TCB', 'MBB', 'SSI']
+QUERIES = ['nhạc thiếu nhi', 'hoạt hình', 'học tiếng anh', 'bé học đếm', 'truyện cổ tích',
+           'khủng long', 'xe cứu hỏa', 'bài hát ru', 'thí nghiệm vui', 'vẽ tranh']
+DEFAULT_MIX = 'static=50,quote=15,board=5,history=10,stats=10,dashboard=5,youtube=5'
+
+
+def static_paths():
+    paths = ['/', '/stock/', '/caro.html', '/flashcard.html']
+    for path in glob.glob(os.path.join(ROOT_DIR, '*', 'dist', 'assets', '*')):
+        paths.append('/' + os.path.relpath(path, ROOT_DIR).replace(os.sep, '/'))
+    return paths
+
+
+def make_request(route, statics):
+    """Trả về (method, path, body) cho một request ngẫu nhiên của route."""
+    t = random.choice(TICKERS)
+    if route == 'static':
+        return 'GET', random.choice(statics), None
+    if route == 'quote':
+        return 'GET', '/api/quote?tickers=' + ','.join(random.sample(TICKERS, 3)), None
+    if route == 'board':
+        return 'GET', '/api/board?tickers=' + ','.join(TICKERS), None
+    if route == 'history':
+        return 'GET', f'/api/history?ticker={t}&count={random.choice((30, 100))}', None
+    if route == 'stats':
+        return 'GET', f'/api/stats?ticker={t}', None
+    if route == 'dashboard':
+        return 'GET', f'/api/dashboard?tickers={",".join(TICKERS)}&ticker={t}', None
+    if route == 'youtube':
+        body = json.dumps({'query': random.choice(QUERIES)}).encode()
+        return 'POST', '/api/youtube-search', body
+    raise ValueError(f'Route không hỗ trợ: {route}')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def wait_port(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server.py thoát sớm (mã {proc.returncode})')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server.py không mở cổng {port} sau {timeout}s')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, yt_port, args, workdir):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'PYTHONPATH': os.pathsep.join(filter(None, [os.path.join(BENCH_DIR, 'fake_vnstock'), env.get('PYTHONPATH')])),
+        'YT_BASE_URL': f'http://127.0.0.1:{yt_port}',
+        'FAKE_VNSTOCK_LATENCY': str(args.vnstock_latency),
+        'FAKE_VNSTOCK_ERROR': str(args.vnstock_error),
+        'HISTORY_DIR': os.path.join(workdir, 'history'),
+        'STATS_CACHE_FILE': os.path.join(workdir, 'stats_cache.json'),
+        'LOG_LEVEL': 'warning',
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'server.py')],
+                            cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wait_port(port, proc)
+    return proc
+
+
+def worker(port, routes, weights, statics, stop_at, samples, keepalive):
+    conn = None
+    while time.monotonic() < stop_at:
+        route = random.choices(routes, weights)[0]
+        method, path, body = make_request(route, statics)
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        if not keepalive:
+            headers['Connection'] = 'close'
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            size = len(resp.read())
+            status = resp.status
+            if resp.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            status, size = 0, 0
+            if conn is not None:
+                conn.close()
+            conn = None
+        samples.append((route, status, time.perf_counter() - start, size))
+    if conn is not None:
+        conn.close()
+
+
+def run_load(port, mix, concurrency, duration, keepalive):
+    routes, weights = list(mix), list(mix.values())
+    statics = static_paths()
+    per_thread = [[] for _ in range(concurrency)]
+    stop_at = time.monotonic() + duration
+    threads = [threading.Thread(target=worker, args=(port, routes, weights, statics, stop_at, per_thread[i], keepalive))
+               for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [s for samples in per_thread for s in samples], time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    by_route = defaultdict(list)
+    for route, status, seconds, size in samples:
+        by_route[route].append((status, seconds, size))
+    by_route['TOTAL'] = [(s, t, n) for _, s, t, n in samples]
+
+    report = {}
+    for route, rows in by_route.items():
+        latencies = sorted(t for _, t, _ in rows)
+        statuses = defaultdict(int)
+        for status, _, _ in rows:
+            statuses[str(status)] += 1
+        report[route] = {
+            'requests': len(rows),
+            'rps': len(rows) / elapsed if elapsed else 0,
+            'errors': sum(1 for s, _, _ in rows if s == 0 or s >= 500),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'bytes': sum(n for _, _, n in rows),
+            'status': dict(statuses),
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f'{"route":<10} {"req":>7} {"rps":>8} {"err":>5} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}  status')
+    for route in sorted(report, key=lambda r: (r == 'TOTAL', r)):
+        r = report[route]
+        line = (f'{route:<10} {r["requests"]:>7} {r["rps"]:>8.1f} {r["errors"]:>5} '
+                f'{r["p50_ms"]:>9.1f} {r["p95_ms"]:>9.1f} {r["p99_ms"]:>9.1f}  '
+                + ' '.join(f'{k}:{v}' for k, v in sorted(r['status'].items())))
+        print(line)
+        if baseline and route in baseline:
+            b = baseline[route]
+
+            def delta(key):
+                return f'{(r[key] / b[key] - 1) * 100:+.0f}%' if b[key] else 'n/a'
+            print(f'{"  vs base":<10} {"":>7} {delta("rps"):>8} {"":>5} '
+                  f'{delta("p50_ms"):>9} {delta("p95_ms"):>9} {delta("p99_ms"):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark server.py với upstream giả lập')
+    parser.add_argument('--concurrency', '-c', type=int, default=16)
+    parser.add_argument('--duration', '-d', type=float, default=15, help='số giây đo')
+    parser.add_argument('--warmup', type=float, default=2, help='số giây chạy nóng trước khi đo')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='trọng số route, vd: static=50,quote=20')
+    parser.add_argument('--no-keepalive', dest='keepalive', action='store_false')
+    parser.add_argument('--vnstock-latency', type=float, default=0.2)
+    parser.add_argument('--vnstock-error', type=float, default=0.0)
+    parser.add_argument('--yt-latency', type=float, default=0.3)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='biến môi trường thêm cho server.py (lặp lại được)')
+    parser.add_argument('--port', type=int, default=0, help='cổng cho server.py (mặc định: cổng trống)')
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    parser.add_argument('--baseline', help='so sánh với file JSON của lần chạy trước')
+    parser.add_argument('--keep-data', action='store_true', help='giữ thư mục tạm (log, cache) sau khi chạy')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    for route in mix:
+        make_request(route, ['/'])
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    yt = fake_youtube.start(latency=args.yt_latency)
+    port = args.port or free_port()
+    proc = start_server(port, yt.server_port, args, workdir)
+    try:
+        if args.warmup > 0:
+            run_load(port, mix, args.concurrency, args.warmup, args.keepalive)
+        samples, elapsed = run_load(port, mix, args.concurrency, args.duration, args.keepalive)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        yt.shutdown()
+
+    report = summarize(samples, elapsed)
+    print(f'server.py :{port}  concurrency={args.concurrency}  {elapsed:.1f}s  '
+          f'keepalive={"on" if args.keepalive else "off"}  vnstock={args.vnstock_latency}s  '
+          f'youtube={args.yt_latency}s ({yt.requests} upstream)  {" ".join(args.env)}')
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'elapsed': elapsed, 'routes': report}, f, indent=2)
+    if args.keep_data:
+        print(f'Dữ liệu tạm: {workdir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,30 @@ import http.server
 import socketserver
 import os
 import json
-import urllib.request
-import urllib.error
+import sys
+import threading
+
+# Cache + pool kết nối dùng chung với server.py ở thư mục gốc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from youtube_upstream import SearchCache, UpstreamPool, normalize_query
 
 PORT = int(os.environ.get('PORT', 8000))
 
+# Cache kết quả tìm YouTube theo query đã chuẩn hoá (LRU + TTL),
+# đặt YT_CACHE_FILE để lưu xuống đĩa và giữ lại sau khi restart
+YT_CACHE_SIZE = int(os.environ.get('YT_CACHE_SIZE', 500))
+YT_CACHE_TTL = float(os.environ.get('YT_CACHE_TTL', 6 * 3600))
+YT_CACHE_FILE = os.environ.get('YT_CACHE_FILE')
+YT_CACHE = SearchCache(YT_CACHE_SIZE, YT_CACHE_TTL, YT_CACHE_FILE)
+
+
+# Pool kết nối HTTPS keep-alive tới YouTube: bỏ qua DNS + TCP + TLS handshake mỗi lần tìm
+YT_HOST = 'www.youtube.com'
+YT_POOL_SIZE = int(os.environ.get('YT_POOL_SIZE', 4))
+YT_TIMEOUT = 10
+YT_POOL = UpstreamPool(YT_HOST, YT_POOL_SIZE, YT_TIMEOUT)
+
+
 class ProxyHandler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
         if self.path == '/api/youtube-search':
@@ -30,66 +49,23 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
 
             print(f'🔍 Searching YouTube: {query}')
 
-            request_body = json.dumps({
-                'context': {
-                    'client': {
-                        'hl': 'vi',
-                        'gl': 'VN',
-                        'clientName': 'WEB',
-                        'clientVersion': '2.20240101.00.00'
-                    }
-                },
-                'query': query
-            }).encode('utf-8')
-
-            req = urllib.request.Request(
-                'https://www.youtube.com/youtubei/v1/search?prettyPrint=false',
-                data=request_body,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-            )
-
-            with urllib.request.urlopen(req, timeout=10) as response:
-                yt_data = json.loads(response.read().decode('utf-8'))
-
-            videos = []
-            try:
-                contents = yt_data.get('contents', {}).get('twoColumnSearchResultsRenderer', {}).get('primaryContents', {}).get('sectionListRenderer', {}).get('contents', [])
-                for section in contents:
-                    items = section.get('itemSectionRenderer', {}).get('contents', [])
-                    for item in items:
-                        video = item.get('videoRenderer')
-                        if video:
-                            video_id = video.get('videoId')
-                            title = video.get('title', {}).get('runs', [{}])[0].get('text', '')
-                            thumbnail = video.get('thumbnail', {}).get('thumbnails', [{}])[-1].get('url', '')
-                            channel = video.get('ownerText', {}).get('runs', [{}])[0].get('text', '')
-                            if video_id and title:
-                                videos.append({
-                                    'id': video_id,
-                                    'videoId': video_id,
-                                    'url': f'https://www.youtube.com/watch?v={video_id}',
-                                    'title': title,
-                                    'thumbnail': f'https://img.youtube.com/vi/{video_id}/mqdefault.jpg',
-                                    'channel': channel
-                                })
-                                if len(videos) >= 20:
-                                    break
-                    if len(videos) >= 20:
-                        break
-            except Exception as e:
-                print(f'Parse error: {e}')
+            cache_key = normalize_query(query)
+            videos = YT_CACHE.get(cache_key)
+            cache_status = 'HIT' if videos is not None else 'MISS'
+            if videos is None:
+                videos = self.search_youtube(query)
+                if videos:
+                    YT_CACHE.put(cache_key, videos)
 
             result = json.dumps({'videos': videos, 'totalResults': len(videos)})
 
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Cache', cache_status)
             self.end_headers()
             self.wfile.write(result.encode('utf-8'))
-            print(f'✅ Found {len(videos)} videos')
+            print(f'✅ Found {len(videos)} videos ({cache_status})')
 
         except Exception as e:
             print(f'❌ YouTube API error: {e}')
@@ -99,9 +75,67 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(json.dumps({'error': str(e), 'videos': []}).encode('utf-8'))
 
+    def search_youtube(self, query):
+        request_body = json.dumps({
+            'context': {
+                'client': {
+                    'hl': 'vi',
+                    'gl': 'VN',
+                    'clientName': 'WEB',
+                    'clientVersion': '2.20240101.00.00'
+                }
+            },
+            'query': query
+        }).encode('utf-8')
+
+        status, raw = YT_POOL.request(
+            'POST',
+            '/youtubei/v1/search?prettyPrint=false',
+            body=request_body,
+            headers={
+                'Content-Type': 'application/json',
+                'Accept-Encoding': 'gzip',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            }
+        )
+        if status != 200:
+            raise RuntimeError(f'YouTube trả về HTTP {status}')
+        yt_data = json.loads(raw.decode('utf-8'))
+
+        videos = []
+        try:
+            contents = yt_data.get('contents', {}).get('twoColumnSearchResultsRenderer', {}).get('primaryContents', {}).get('sectionListRenderer', {}).get('contents', [])
+            for section in contents:
+                items = section.get('itemSectionRenderer', {}).get('contents', [])
+                for item in items:
+                    video = item.get('videoRenderer')
+                    if video:
+                        video_id = video.get('videoId')
+                        title = video.get('title', {}).get('runs', [{}])[0].get('text', '')
+                        thumbnail = video.get('thumbnail', {}).get('thumbnails', [{}])[-1].get('url', '')
+                        channel = video.get('ownerText', {}).get('runs', [{}])[0].get('text', '')
+                        if video_id and title:
+                            videos.append({
+                                'id': video_id,
+                                'videoId': video_id,
+                                'url': f'https://www.youtube.com/watch?v={video_id}',
+                                'title': title,
+                                'thumbnail': f'https://img.youtube.com/vi/{video_id}/mqdefault.jpg',
+                                'channel': channel
+                            })
+                            if len(videos) >= 20:
+                                break
+                if len(videos) >= 20:
+                    break
+        except Exception as e:
+            print(f'Parse error: {e}')
+        return videos
+
+
 class ReusableTCPServer(socketserver.TCPServer):
     allow_reuse_address = True
 
+threading.Thread(target=YT_POOL.warm_up, name='yt-warm-up', daemon=True).start()
 with ReusableTCPServer(('0.0.0.0', PORT), ProxyHandler) as httpd:
     print(f'Serving at http://0.0.0.0:{PORT}')
     httpd.serve_forever()
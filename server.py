@@ -1,61 +1,1306 @@
 import http.server
 import socketserver
 import urllib.parse
-import urllib.request
 import urllib.error
+import atexit
 import json
+import gzip
+import io
+import re
 import random
 import sys
 import os
-from datetime import datetime, timedelta
+import queue
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from datetime import datetime, timedelta, timezone
+
+# Thời gian từng giai đoạn khởi động (giây), báo cáo ở banner, log và /api/status
+STARTUP_STARTED = time.monotonic()
+STARTUP_PHASES = {}
 
 # Thêm đường dẫn cài đặt thư viện vào sys.path
 sys.path.append(os.path.expanduser("~/.local/lib/python3.10/site-packages"))
 
 try:
-    import pandas as pd
+    import numpy as np
 except ImportError as e:
-    pd = None
-    print(f"Pandas chưa được cài đặt: {e}, tiếp tục không dùng pandas.")
+    np = None
+    print(f"Numpy chưa được cài đặt: {e}, không lưu lịch sử giá xuống đĩa.")
 
-# Thử import vnstock v3
 try:
-    from vnstock import Quote, Finance
-    VNSTOCK_AVAILABLE = True
-    print("Vnstock v3 đã sẵn sàng.")
-except ImportError as e:
-    VNSTOCK_AVAILABLE = False
-    print(f"Vnstock chưa được cài đặt hoặc lỗi import: {e}, sử dụng giả lập.")
+    import brotli
+except ImportError:
+    brotli = None
+
+from server_log import AsyncLogger
+from server_metrics import Metrics
+from server_pool import PooledHTTPServer
+from server_profiler import LOCAL_ADDRESSES, RequestProfiler
+from server_timing import begin_request, bind_timing, end_request, timed
+from youtube_upstream import SearchCache, UpstreamPool, normalize_query
 
-PORT = 8000
+# pandas và vnstock import rất chậm: nạp ở thread nền (MARKET_LOADER) sau khi đã bind cổng,
+# để web tĩnh phục vụ được ngay. Trước khi nạp xong API dùng cache hoặc dữ liệu giả lập
+pd = None
+Quote = Finance = Trading = None
+VNSTOCK_AVAILABLE = False
+BOARD_AVAILABLE = False
+
+STARTUP_PHASES['import'] = time.monotonic() - STARTUP_STARTED
+
+PORT = int(os.environ.get('PORT', 8000))
 HOST = "0.0.0.0"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Chế độ phục vụ: 'pool' (thread pool giới hạn) hoặc 'single' (mỗi lần 1 kết nối như cũ)
+SERVER_MODE = os.environ.get('SERVER_MODE', 'pool')
+# Số worker tối đa của pool, và số kết nối được xếp hàng chờ worker
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 32))
+MAX_QUEUED = int(os.environ.get('MAX_QUEUED', 64))
+# Số request /api/ chạy đồng thời tối đa, phần worker còn lại luôn dành cho file tĩnh
+MAX_API_INFLIGHT = int(os.environ.get('MAX_API_INFLIGHT', 8))
+RETRY_AFTER = int(os.environ.get('RETRY_AFTER', 2))
+# Giữ kết nối HTTP/1.1 (keep-alive): đóng khi rảnh quá KEEPALIVE_TIMEOUT giây
+# hoặc đã phục vụ KEEPALIVE_MAX_REQUESTS request
+KEEPALIVE = os.environ.get('KEEPALIVE', '1') != '0'
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 5))
+KEEPALIVE_MAX_REQUESTS = int(os.environ.get('KEEPALIVE_MAX_REQUESTS', 100))
+# Kết nối keep-alive đang rảnh được giữ ngoài pool (không chiếm worker), tối đa MAX_IDLE_CONNECTIONS
+MAX_IDLE_CONNECTIONS = int(os.environ.get('MAX_IDLE_CONNECTIONS', 1000))
+
+API_SLOTS = threading.BoundedSemaphore(MAX_API_INFLIGHT)
+# Kết nối SSE giữ worker suốt phiên nên có giới hạn riêng, không quá nửa số worker
+# để luôn còn worker cho file tĩnh và API
+MAX_STREAMS = max(1, min(int(os.environ.get('MAX_STREAMS', 16)), MAX_WORKERS // 2))
+STREAM_SLOTS = threading.BoundedSemaphore(MAX_STREAMS)
 
 BASE_PRICES = {
     'VIC': 43.5, 'VHM': 41.2, 'FPT': 96.8, 'VNM': 67.5,
     'TCB': 34.2, 'VCB': 91.0, 'HPG': 28.5, 'MWG': 45.3
 }
 
+# Log ghi qua queue để thread xử lý request không phải chờ I/O; thread nền gom theo lô.
+# LOG_STATIC_SAMPLE: tỉ lệ request file tĩnh thành công được ghi access log (0..1)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_STATIC_SAMPLE = float(os.environ.get('LOG_STATIC_SAMPLE', 0.1))
+LOG = AsyncLogger(sys.stderr, LOG_LEVEL, LOG_FORMAT)
+atexit.register(LOG.close)
+
+
+# Metrics kiểu Prometheus cho /metrics
+API_ROUTES = {'quote', 'board', 'history', 'stats', 'stats/batch', 'dashboard', 'stream', 'status', 'youtube-search',
+              'profile'}
+METRICS = Metrics()
+
+
+# Profile cProfile cho một phần request API: lấy mẫu theo PROFILE_SAMPLE (0..1) hoặc gửi
+# header "X-Profile: 1" từ localhost. File .prof (pstats) mở bằng snakeviz/flameprof/gprof2dot,
+# thư mục chỉ giữ PROFILE_KEEP file mới nhất; tổng hợp hàm tốn thời gian ở /api/profile
+PROFILE_SAMPLE = float(os.environ.get('PROFILE_SAMPLE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'demo-server-profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILER = RequestProfiler(PROFILE_DIR, PROFILE_SAMPLE, PROFILE_KEEP, log=LOG.error, metrics=METRICS)
+
+
+# TTL (giây) của cache giá: ngắn trong phiên HOSE, dài hơn khi thị trường đóng cửa
+QUOTE_TTL = float(os.environ.get('QUOTE_TTL', 15))
+QUOTE_TTL_CLOSED = float(os.environ.get('QUOTE_TTL_CLOSED', 600))
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def is_trading_hours(now=None):
+    # Phiên HOSE: 9:00-11:30 và 13:00-14:45, thứ 2 đến thứ 6 (giờ Việt Nam)
+    now = now or datetime.now(VN_TZ)
+    if now.weekday() >= 5:
+        return False
+    minutes = now.hour * 60 + now.minute
+    return 9 * 60 <= minutes <= 11 * 60 + 30 or 13 * 60 <= minutes <= 14 * 60 + 45
+
+
+def quote_ttl():
+    return QUOTE_TTL if is_trading_hours() else QUOTE_TTL_CLOSED
+
+
+class _Flight:
+    # Một lần gọi upstream đang chạy, các request khác cùng key sẽ chờ kết quả này
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Cache theo key có TTL, các lần miss đồng thời cùng key chỉ gọi loader một lần."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.entries = {}   # key -> (value, fetched_at)
+        self.flights = {}   # key -> _Flight
+
+    @timed('cache')
+    def peek(self, key, ttl):
+        # Trả về (value, age) nếu còn hạn, không gọi upstream
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[1] < ttl:
+            return entry[0], time.time() - entry[1]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.store(key, value)
+
+    def store(self, key, value):
+        # Gọi khi đang giữ self.lock
+        self.entries[key] = (value, time.time())
+
+    def discard(self, key, value):
+        # Bỏ entry nếu vẫn là value (không xoá nhầm bản mới hơn do thread khác vừa ghi)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is value:
+                del self.entries[key]
+
+    @timed('cache')
+    def get(self, key, loader, ttl):
+        # Trả về (value, age): age là số giây kể từ lần lấy dữ liệu từ upstream
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] < ttl:
+                METRICS.inc('cache_requests_total', (('cache', self.name), ('result', 'hit')))
+                return entry[0], time.time() - entry[1]
+            METRICS.inc('cache_requests_total', (('cache', self.name), ('result', 'miss')))
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 0.0
+
+        try:
+            flight.value = loader()
+            with self.lock:
+                self.store(key, flight.value)
+            return flight.value, 0.0
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+
+QUOTE_CACHE = TTLCache('quote')
+
+# Circuit breaker cho từng nguồn upstream: lỗi liên tiếp (hoặc gọi quá chậm) thì mở mạch,
+# trong lúc mở trả ngay cache/giả lập, hết cooldown cho 1 request thử (half-open)
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_SLOW_CALL = float(os.environ.get('BREAKER_SLOW_CALL', 3))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', 30))
+
+
+# Hạn chót cho mỗi lần gọi vnstock: chạy trong pool riêng, quá hạn thì bỏ chờ và
+# trả cache/giả lập. Worker bị treo vẫn giữ slot nên số call treo không vượt MARKET_WORKERS
+MARKET_TIMEOUT = float(os.environ.get('MARKET_TIMEOUT', 8))
+MARKET_WORKERS = int(os.environ.get('MARKET_WORKERS', 8))
+MARKET_EXECUTOR = ThreadPoolExecutor(max_workers=MARKET_WORKERS, thread_name_prefix='market')
+MARKET_SLOTS = threading.BoundedSemaphore(MARKET_WORKERS)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ReplayMiss(LookupError):
+    """Chế độ replay nhưng archive không có bản ghi cho request này."""
+
+
+def call_with_deadline(fn, *args, timeout=MARKET_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    # Mọi worker đều đang kẹt ở call treo: báo lỗi luôn, không xếp hàng thêm
+    if not MARKET_SLOTS.acquire(timeout=timeout):
+        raise DeadlineExceeded(f"không còn worker trống sau {timeout}s")
+
+    def run():
+        try:
+            return fn(*args)
+        finally:
+            MARKET_SLOTS.release()
+
+    future = MARKET_EXECUTOR.submit(PROFILER.wrap(bind_timing(run)))
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise DeadlineExceeded(f"quá thời gian {timeout}s") from None
+
+
+class CircuitBreaker:
+    """closed -> open sau BREAKER_FAILURES lần lỗi/chậm liên tiếp -> half-open sau cooldown.
+
+    Chỉ request thử (probe) lúc half-open mới đóng lại được mạch; kết quả về muộn của các call
+    bắt đầu trước khi mạch mở bị bỏ qua. Lỗi thuộc request_errors (mã sai, không có dữ liệu...)
+    là lỗi của chính request, không tính vào số lỗi của upstream.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, slow_call=BREAKER_SLOW_CALL, cooldown=BREAKER_COOLDOWN,
+                 timeout=None, request_errors=()):
+        self.name = name
+        self.timeout = timeout
+        self.max_failures = failures
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.request_errors = request_errors
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        # Tăng mỗi lần mở mạch, để nhận ra kết quả của call bắt đầu từ lượt closed trước
+        self.generation = 0
+        self.last_error = None
+
+    def allow(self):
+        # Trả về vé (generation, probe) nếu được gọi, None nếu mạch đang mở
+        with self.lock:
+            if self.state == 'closed':
+                return self.generation, False
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return self.generation, True
+            return None
+
+    def record(self, ticket, ok, error=None):
+        # ok=None: kết quả không nói gì về upstream (lỗi của request), chỉ trả lượt probe
+        generation, probe = ticket
+        with self.lock:
+            if probe:
+                self.probing = False
+            elif self.state != 'closed' or generation != self.generation:
+                return
+            if ok is None:
+                return
+            if ok:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            self.last_error = error
+            if probe or self.failures >= self.max_failures:
+                if self.state != 'open':
+                    LOG.warning("Mở circuit breaker", provider=self.name, error=error)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.generation += 1
+
+    def is_request_error(self, error):
+        # JSON/Unicode hỏng là do upstream trả rác, không phải do request
+        return (isinstance(error, self.request_errors)
+                and not isinstance(error, (json.JSONDecodeError, UnicodeDecodeError)))
+
+    @timed('upstream')
+    def call(self, fn, *args):
+        ticket = self.allow()
+        if ticket is None:
+            raise CircuitOpenError(f"{self.name} đang tạm ngắt")
+        provider = (('provider', self.name),)
+        started = time.monotonic()
+        try:
+            if self.timeout:
+                result = call_with_deadline(fn, *args, timeout=self.timeout)
+            else:
+                result = fn(*args)
+        except ReplayMiss:
+            # Archive thiếu bản ghi không phải lỗi upstream, không được làm mở breaker
+            self.record(ticket, None)
+            raise
+        except Exception as e:
+            METRICS.observe('upstream_request_duration_seconds', provider, time.monotonic() - started)
+            if self.is_request_error(e):
+                self.record(ticket, None)
+                raise
+            METRICS.inc('upstream_errors_total', provider)
+            self.record(ticket, False, str(e))
+            raise
+        elapsed = time.monotonic() - started
+        METRICS.observe('upstream_request_duration_seconds', provider, elapsed)
+        # Gọi thành công nhưng quá chậm vẫn tính là lỗi
+        self.record(ticket, elapsed < self.slow_call, f"chậm {elapsed:.1f}s")
+        return result
+
+    def status(self):
+        with self.lock:
+            status = {"state": self.state, "failures": self.failures, "lastError": self.last_error}
+            if self.state != 'closed':
+                status["retryIn"] = max(0.0, round(self.cooldown - (time.monotonic() - self.opened_at), 1))
+            return status
+
+
+# vnstock báo mã sai / không có dữ liệu bằng ValueError, KeyError, IndexError
+VCI_BREAKER = CircuitBreaker('vnstock (VCI)', timeout=MARKET_TIMEOUT, request_errors=(ValueError, KeyError, IndexError))
+YT_BREAKER = CircuitBreaker('youtube')
+
+# Pool gọi upstream dùng chung, lấy giá nhiều mã song song
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', 8))
+QUOTE_DEADLINE = float(os.environ.get('QUOTE_DEADLINE', 5))
+UPSTREAM_EXECUTOR = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream')
+
+
+class PersistentTTLCache(TTLCache):
+    """TTLCache lưu xuống file JSON; hết hạn thì trả bản cũ ngay và làm mới ở nền."""
+
+    def __init__(self, name, path):
+        super().__init__(name)
+        self.path = path
+        self.refreshing = set()
+        self.save_timer = None
+        self.save_lock = threading.Lock()
+        atexit.register(self.flush)
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.entries = {k: (v['data'], v['timestamp'] / 1000) for k, v in saved.items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def store(self, key, value):
+        # Gọi khi đang giữ self.lock: chỉ hẹn lưu, ghi file ở thread timer ngoài lock,
+        # nhiều lần ghi liền nhau gộp thành 1 lần lưu
+        super().store(key, value)
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(1.0, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        # Lúc thoát: lưu nốt thay đổi còn chờ timer
+        if self.save_timer is not None:
+            self.save_timer.cancel()
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            snapshot = {k: {'data': v, 'timestamp': int(t * 1000)} for k, (v, t) in self.entries.items()}
+        with self.save_lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                LOG.error("Lỗi lưu cache", cache=self.name, error=str(e))
+
+    def get(self, key, loader, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[1] >= ttl:
+            METRICS.inc('cache_requests_total', (('cache', self.name), ('result', 'stale')))
+            self.refresh(key, loader)
+            return entry[0], time.time() - entry[1]
+        return super().get(key, loader, ttl)
+
+    def refresh(self, key, loader):
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def run():
+            try:
+                # ttl=0 buộc gọi loader (vẫn qua single-flight của TTLCache)
+                TTLCache.get(self, key, loader, 0)
+            except Exception as e:
+                LOG.warning("Lỗi làm mới cache", cache=self.name, key=key, error=str(e))
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        UPSTREAM_EXECUTOR.submit(run)
+
+
+# Chỉ số tài chính năm gần như không đổi: cache theo ngày, lưu xuống đĩa
+STATS_TTL = float(os.environ.get('STATS_TTL', 24 * 3600))
+STATS_CACHE_FILE = os.environ.get('STATS_CACHE_FILE', os.path.join(BASE_DIR, 'stock', 'data', 'stats_cache.json'))
+STATS_CACHE = PersistentTTLCache('stats', STATS_CACHE_FILE)
+STATS_FIELDS = ('pe', 'pb', 'roe', 'marketCap', 'eps')
+
+# Pool riêng để ghép dashboard: các phần con tự dùng UPSTREAM_EXECUTOR bên trong,
+# chạy chung pool sẽ có nguy cơ chờ lẫn nhau
+DASHBOARD_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_API_INFLIGHT * 2, thread_name_prefix='dashboard')
+DASHBOARD_DEADLINE = float(os.environ.get('DASHBOARD_DEADLINE', 8))
+
+# Lịch sử giá lưu mỗi mã 1 file .npy, chỉ tải thêm các phiên mới từ upstream
+HISTORY_DIR = os.environ.get('HISTORY_DIR', os.path.join(BASE_DIR, 'stock', 'data', 'history'))
+HISTORY_BARS = 100
+HISTORY_MAX_BARS = int(os.environ.get('HISTORY_MAX_BARS', 5000))
+HISTORY_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class HistoryStore:
+    """Kho lịch sử OHLC trên đĩa, mỗi mã là một mảng numpy có cấu trúc."""
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.dtype = np.dtype([('time', 'datetime64[D]')] + [(f, 'f8') for f in HISTORY_FIELDS]) if np else None
+
+    def enabled(self, ticker):
+        # Chỉ nhận mã chữ/số để tên file không thoát ra ngoài thư mục lưu trữ
+        return np is not None and pd is not None and ticker.isalnum()
+
+    def path(self, ticker):
+        return os.path.join(self.root, f"{ticker.upper()}.npy")
+
+    def load(self, ticker):
+        try:
+            return np.load(self.path(ticker), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def append(self, ticker, new_bars):
+        # Phiên cuối cùng đã lưu có thể chưa chốt giá nên ghi đè bằng dữ liệu mới
+        with self.lock:
+            old = self.load(ticker)
+            if old is not None and len(old) and len(new_bars):
+                old = np.asarray(old[old['time'] < new_bars['time'][0]])
+                bars = np.concatenate([old, new_bars])
+            elif old is not None and len(old):
+                bars = np.asarray(old)
+            else:
+                bars = new_bars
+
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.path(ticker) + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, bars)
+            os.replace(tmp, self.path(ticker))
+            return bars
+
+    @timed('dataframe')
+    def from_frame(self, df):
+        time_col = 'time' if 'time' in df.columns else (df.index.name if df.index.name else 'time')
+
+        if time_col not in df.columns:
+            df = df.reset_index()
+            time_col = time_col if time_col in df.columns else df.columns[0]
+
+        bars = np.empty(len(df), dtype=self.dtype)
+        bars['time'] = pd.to_datetime(df[time_col]).to_numpy().astype('datetime64[D]')
+        for f in HISTORY_FIELDS:
+            bars[f] = df[f].to_numpy(dtype='f8') if f in df.columns else np.nan
+        return np.sort(bars, order='time')
+
+
+HISTORY_STORE = HistoryStore(HISTORY_DIR)
+# Lần đồng bộ gần nhất của từng mã: ticker -> (bars, số phiên đã đồng bộ), dùng chung TTL với cache giá.
+# Mỗi mã đồng bộ theo count lớn nhất từng được yêu cầu, request tự cắt count phiên cuối
+HISTORY_CACHE = TTLCache('history')
+HISTORY_DEPTH = {}
+
+
+@timed('dataframe')
+def history_records(bars):
+    # Xử lý theo cột: format ngày và nhân giá cho cả mảng, không duyệt từng dòng
+    dates = np.datetime_as_string(bars['time'], unit='D').tolist()
+    closes = (bars['close'] * 1000).tolist()
+    return [{"tradingDate": d, "close": c} for d, c in zip(dates, closes)]
+
+
+def parse_count(value, default=HISTORY_BARS):
+    try:
+        return max(1, min(int(value), HISTORY_MAX_BARS))
+    except (TypeError, ValueError):
+        return default
+
+
+def session_progress(now=None):
+    # Tỉ lệ thời gian phiên hôm nay đã trôi qua (0 trước 9:00, 1 sau 14:45), bỏ giờ nghỉ trưa
+    now = now or datetime.now(VN_TZ)
+    minutes = now.hour * 60 + now.minute
+    morning = min(max(minutes - 9 * 60, 0), 150)
+    afternoon = min(max(minutes - 13 * 60, 0), 105)
+    return (morning + afternoon) / 255
+
+
+class SimulatedMarket:
+    """Thị trường giả lập: log giá mỗi mã là một quá trình hồi quy về trung bình (Ornstein-Uhlenbeck)
+    quanh log(BASE_PRICES), seed cố định theo mã.
+
+    Giá đóng cửa từng phiên chỉ được nối thêm khi sang phiên mới, không bao giờ viết lại các
+    phiên cũ, nên quote và history của cùng một mã luôn khớp nhau giữa các request và giữa các
+    ngày; hồi quy giữ giá dao động quanh giá gốc (độ lệch chuẩn dài hạn ~ sigma / sqrt(2 * theta)).
+    """
+
+    def __init__(self, epoch='2020-01-01', theta=0.02, sigma=0.015):
+        self.epoch = np.datetime64(epoch, 'D')
+        self.theta = theta
+        self.sigma = sigma
+        self.lock = threading.Lock()
+        self.series = {}   # ticker -> [log giá đóng cửa, Generator]
+
+    def seed(self, ticker):
+        # crc32 ổn định giữa các lần chạy (hash() của Python thì không)
+        return zlib.crc32(ticker.upper().encode())
+
+    def trading_days(self, now):
+        # Các phiên từ epoch tới hôm nay, phiên hôm nay chỉ tính khi đã mở cửa
+        today = np.datetime64(now.date(), 'D')
+        if session_progress(now) == 0:
+            today -= 1
+        days = np.arange(self.epoch, today + 1)
+        return days[np.is_busday(days)]
+
+    def closes(self, ticker, days):
+        with self.lock:
+            entry = self.series.get(ticker)
+            if entry is None:
+                entry = self.series[ticker] = [np.empty(0), np.random.default_rng(self.seed(ticker))]
+            log_prices, rng = entry
+            n = len(days) - len(log_prices)
+            if n > 0:
+                mean = np.log(BASE_PRICES.get(ticker, 50.0))
+                x = log_prices[-1] if len(log_prices) else mean
+                shocks = self.sigma * rng.standard_normal(n)
+                new = np.empty(n)
+                for i in range(n):
+                    x += self.theta * (mean - x) + shocks[i]
+                    new[i] = x
+                log_prices = entry[0] = np.concatenate([log_prices, new])
+        return np.exp(log_prices[:len(days)])
+
+    def quote(self, ticker, now=None):
+        # Trả về (giá hiện tại, giá tham chiếu) theo nghìn VND
+        now = now or datetime.now(VN_TZ)
+        days = self.trading_days(now)
+        closes = self.closes(ticker, days)
+        close, ref = closes[-1], closes[-2]
+        if days[-1] != np.datetime64(now.date(), 'D'):
+            return close, ref
+        # Trong phiên: đi từ giá tham chiếu tới giá đóng cửa, nhiễu cố định theo từng phút
+        frac = session_progress(now)
+        minute = now.hour * 60 + now.minute
+        z = np.random.default_rng([self.seed(ticker), minute]).standard_normal()
+        log_move = frac * np.log(close / ref) + np.sqrt(frac * (1 - frac)) * self.sigma * z
+        return float(ref * np.exp(log_move)), float(ref)
+
+    def history(self, ticker, count, now=None):
+        # count phiên gần nhất, mới nhất đứng đầu (giống dữ liệu giả lập trước đây)
+        now = now or datetime.now(VN_TZ)
+        days = self.trading_days(now)
+        closes = self.closes(ticker, days)[-count:][::-1].copy()
+        closes[0] = self.quote(ticker, now)[0]
+        dates = np.char.add(np.datetime_as_string(days[-count:][::-1], unit='D'), 'T00:00:00Z')
+        return [{"tradingDate": d, "close": c} for d, c in zip(dates.tolist(), (closes * 1000).tolist())]
+
+
+SIM_MARKET = SimulatedMarket() if np is not None else None
+
+
+# Chu kỳ poll của luồng giá (SSE) và chu kỳ gửi heartbeat cho client
+STREAM_INTERVAL = float(os.environ.get('STREAM_INTERVAL', 5))
+STREAM_HEARTBEAT = 15
+
+
+class QuoteStream:
+    """Một poller nền lấy giá cho mọi client SSE, chỉ đẩy các mã có thay đổi."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.subscribers = {}   # queue -> set(tickers)
+        self.last = {}          # ticker -> (price, basicPrice) đã gửi gần nhất
+        self.fetch = None
+        self.thread = None
+
+    def subscribe(self, tickers, fetch, snapshot=None):
+        # fetch(tickers_csv) trả về dict giống /api/board; snapshot là bản client vừa nhận,
+        # dùng làm mốc so sánh để lần poll đầu không gửi lại các mã chưa đổi
+        q = queue.Queue(maxsize=16)
+        with self.lock:
+            self.subscribers[q] = set(tickers)
+            self.fetch = fetch
+            for quote in (snapshot or {}).get('data', []):
+                self.last.setdefault(quote['ticker'], (quote.get('price'), quote.get('basicPrice')))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='quote-stream', daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.pop(q, None)
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    # Không còn client thì dừng poller, lần subscribe sau sẽ khởi động lại
+                    self.thread = None
+                    self.last.clear()
+                    return
+                tickers = sorted(set().union(*self.subscribers.values()))
+                fetch = self.fetch
+
+            try:
+                quotes = fetch(','.join(tickers)).get('data', [])
+            except Exception as e:
+                LOG.warning("Lỗi luồng giá", error=str(e))
+                quotes = []
+
+            changed = []
+            for quote in quotes:
+                key = (quote.get('price'), quote.get('basicPrice'))
+                if self.last.get(quote['ticker']) != key:
+                    self.last[quote['ticker']] = key
+                    changed.append(quote)
+
+            if changed:
+                with self.lock:
+                    subscribers = list(self.subscribers.items())
+                for q, subs in subscribers:
+                    mine = [c for c in changed if c['ticker'] in subs]
+                    if mine:
+                        try:
+                            q.put_nowait(mine)
+                        except queue.Full:
+                            # Client đọc quá chậm: bỏ bớt bản cũ, giữ bản mới nhất
+                            try:
+                                q.get_nowait()
+                            except queue.Empty:
+                                pass
+                            q.put_nowait(mine)
+
+            time.sleep(self.interval)
+
+
+QUOTE_STREAM = QuoteStream(STREAM_INTERVAL)
+
+
+# File tĩnh: nén gzip/brotli một lần rồi giữ trong bộ nhớ (giới hạn theo MB)
+STATIC_CACHE_MB = int(os.environ.get('STATIC_CACHE_MB', 64))
+STATIC_MIN_COMPRESS = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/wasm')
+# Bundle Vite có hash trong tên (vd: assets/index-B6yooz6S.js) nên cache vĩnh viễn được
+# File lớn hơn ngưỡng này gửi bằng sendfile (zero-copy) thay vì copy qua buffer Python
+SENDFILE_MIN = int(os.environ.get('SENDFILE_MIN', 256 * 1024))
+HASHED_ASSET = re.compile(r'/assets/[^/]+-[A-Za-z0-9_]{8,}\.\w+$')
+
+
+class CompressedCache:
+    """LRU các bản nén của file tĩnh, key gồm mtime/size nên tự hết hạn khi file đổi."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key, loader):
+        # Trả về (body, hit)
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                METRICS.inc('cache_requests_total', (('cache', 'static'), ('result', 'hit')))
+                return body, True
+        METRICS.inc('cache_requests_total', (('cache', 'static'), ('result', 'miss')))
+        body = loader()
+        with self.lock:
+            if key not in self.entries and len(body) <= self.max_bytes:
+                self.entries[key] = body
+                self.size += len(body)
+                while self.size > self.max_bytes:
+                    _, old = self.entries.popitem(last=False)
+                    self.size -= len(old)
+        return body, False
+
+
+STATIC_CACHE = CompressedCache(STATIC_CACHE_MB * 1024 * 1024)
+
+
+def compress(path, encoding):
+    # Ưu tiên file nén sẵn cạnh file gốc (vd: index.js.br) nếu còn mới
+    suffix = '.br' if encoding == 'br' else '.gz'
+    try:
+        if os.stat(path + suffix).st_mtime >= os.stat(path).st_mtime:
+            with open(path + suffix, 'rb') as f:
+                return f.read()
+    except OSError:
+        pass
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if encoding == 'br':
+        return brotli.compress(raw, quality=9)
+    return gzip.compress(raw, compresslevel=9, mtime=0)
+
+
+def parse_range(header, size):
+    # Chỉ hỗ trợ 1 khoảng: bytes=a-b, bytes=a-, bytes=-n. Trả về (start, length) hoặc None
+    m = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header)
+    if not m or (not m.group(1) and not m.group(2)):
+        return (0, size)
+    if not m.group(1):
+        suffix = int(m.group(2))
+        if suffix == 0:
+            return None
+        start = max(0, size - suffix)
+        return (start, size - start)
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    end = min(end, size - 1)
+    return (start, end - start + 1)
+
+
+# Cache kết quả tìm YouTube theo query đã chuẩn hoá (LRU + TTL),
+# đặt YT_CACHE_FILE để lưu xuống đĩa và giữ lại sau khi restart
+YT_CACHE_SIZE = int(os.environ.get('YT_CACHE_SIZE', 500))
+YT_CACHE_TTL = float(os.environ.get('YT_CACHE_TTL', 6 * 3600))
+YT_CACHE_FILE = os.environ.get('YT_CACHE_FILE')
+YT_CACHE = SearchCache(YT_CACHE_SIZE, YT_CACHE_TTL, YT_CACHE_FILE, log=LOG.error)
+
+
+# Pool kết nối HTTPS keep-alive tới YouTube: bỏ qua DNS + TCP + TLS handshake mỗi lần tìm.
+# YT_BASE_URL cho phép trỏ sang server giả lập (vd: bench/) khi đo hiệu năng
+YT_BASE_URL = urllib.parse.urlsplit(os.environ.get('YT_BASE_URL', 'https://www.youtube.com'))
+YT_POOL_SIZE = int(os.environ.get('YT_POOL_SIZE', 4))
+YT_TIMEOUT = 10
+YT_POOL = UpstreamPool(YT_BASE_URL.netloc, YT_POOL_SIZE, YT_TIMEOUT, secure=YT_BASE_URL.scheme == 'https',
+                       log=LOG.warning)
+
+
+# Ghi/phát lại phản hồi upstream (vnstock + YouTube) để đo hiệu năng và demo offline:
+#   UPSTREAM_MODE=record  gọi upstream thật và lưu phản hồi vào archive
+#   UPSTREAM_MODE=replay  chỉ đọc archive, không gọi mạng; thiếu bản ghi thì dùng fallback
+# UPSTREAM_REPLAY_LATENCY: số giây chờ thêm mỗi lần phát lại, hoặc 'recorded' để dùng đúng độ trễ đã ghi
+UPSTREAM_MODE = os.environ.get('UPSTREAM_MODE', 'live').lower()
+UPSTREAM_ARCHIVE_FILE = os.environ.get(
+    'UPSTREAM_ARCHIVE_FILE', os.path.join(BASE_DIR, 'stock', 'data', 'upstream_archive.json.gz'))
+UPSTREAM_REPLAY_LATENCY = os.environ.get('UPSTREAM_REPLAY_LATENCY', '0')
+
+
+def pack_frame(df):
+    # DataFrame -> JSON theo cột, giữ được cột MultiIndex và cột thời gian
+    if df.index.name is not None:
+        df = df.reset_index()
+    columns, dtypes, values = [], [], []
+    for i, (name, dtype) in enumerate(df.dtypes.items()):
+        col = df.iloc[:, i]
+        columns.append(list(name) if isinstance(name, tuple) else name)
+        dtypes.append(str(dtype))
+        values.append(col.astype(str).tolist() if dtype.kind == 'M' else col.tolist())
+    return {'columns': columns, 'dtypes': dtypes, 'values': values}
+
+
+def unpack_frame(packed):
+    df = pd.DataFrame({i: v for i, v in enumerate(packed['values'])})
+    for i, dtype in enumerate(packed['dtypes']):
+        if dtype.startswith('datetime64'):
+            df[i] = pd.to_datetime(df[i], errors='coerce')
+        elif dtype != 'object':
+            try:
+                df[i] = df[i].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    columns = [tuple(c) if isinstance(c, list) else c for c in packed['columns']]
+    if columns and all(isinstance(c, tuple) for c in columns):
+        df.columns = pd.MultiIndex.from_tuples(columns)
+    else:
+        df.columns = columns
+    return df
+
+
+class UpstreamArchive:
+    """Archive gzip JSON các phản hồi upstream, khoá theo (loại, tham số) của request."""
+
+    def __init__(self, mode, path, replay_latency='0'):
+        self.mode = mode if mode in ('record', 'replay') else 'live'
+        self.path = path
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.save_timer = None
+        if self.mode == 'live':
+            return
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            if self.mode == 'replay':
+                LOG.warning('Không đọc được archive upstream', path=path, error=str(e))
+        if self.mode == 'record':
+            atexit.register(self.save)
+
+    @staticmethod
+    def key(kind, args):
+        return json.dumps([kind, args], sort_keys=True, ensure_ascii=False, default=str)
+
+    def call(self, kind, args, fn, pack=None, unpack=None):
+        if self.mode == 'live':
+            return fn()
+        key = self.key(kind, args)
+        if self.mode == 'replay':
+            with self.lock:
+                entry = self.entries.get(key)
+            METRICS.inc('upstream_archive_total', (('kind', kind), ('result', 'hit' if entry else 'miss')))
+            if entry is None:
+                raise ReplayMiss(f"archive không có {kind} {args}")
+            delay = entry['elapsed'] if self.replay_latency == 'recorded' else float(self.replay_latency)
+            if delay > 0:
+                time.sleep(delay)
+            return unpack(entry['value']) if unpack else entry['value']
+
+        started = time.monotonic()
+        result = fn()
+        entry = {
+            'value': pack(result) if pack else result,
+            'elapsed': round(time.monotonic() - started, 4),
+            'recorded': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        with self.lock:
+            self.entries[key] = entry
+            # Gộp nhiều lần ghi liền nhau thành 1 lần lưu file
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(1.0, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+        METRICS.inc('upstream_archive_total', (('kind', kind), ('result', 'recorded')))
+        return result
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            snapshot = dict(self.entries)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=6) as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            LOG.error('Lỗi lưu archive upstream', path=self.path, error=str(e))
+
+    def status(self):
+        with self.lock:
+            return {"mode": self.mode, "entries": len(self.entries)}
+
+
+UPSTREAM_ARCHIVE = UpstreamArchive(UPSTREAM_MODE, UPSTREAM_ARCHIVE_FILE, UPSTREAM_REPLAY_LATENCY)
+
+# Request API tới trong lúc đang nạp thư viện chờ tối đa MARKET_IMPORT_WAIT giây,
+# quá thời gian thì trả cache / dữ liệu giả lập
+MARKET_IMPORT_WAIT = float(os.environ.get('MARKET_IMPORT_WAIT', 1.5))
+
+
+class MarketLoader:
+    """Import pandas + vnstock ở thread nền và gán vào biến toàn cục khi xong."""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self.run, name='market-import', daemon=True).start()
+
+    def run(self):
+        global pd, Quote, Finance, Trading, VNSTOCK_AVAILABLE, BOARD_AVAILABLE
+        try:
+            started = time.monotonic()
+            try:
+                import pandas
+                pd = pandas
+            except ImportError as e:
+                print(f"Pandas chưa được cài đặt: {e}, tiếp tục không dùng pandas.")
+            STARTUP_PHASES['pandas'] = time.monotonic() - started
+
+            # Thử import vnstock v3
+            started = time.monotonic()
+            try:
+                from vnstock import Quote, Finance
+                VNSTOCK_AVAILABLE = True
+                print("Vnstock v3 đã sẵn sàng.")
+            except ImportError as e:
+                print(f"Vnstock chưa được cài đặt hoặc lỗi import: {e}, sử dụng giả lập.")
+            # Bảng giá (price board) lấy nhiều mã trong 1 lần gọi
+            try:
+                from vnstock import Trading
+                BOARD_AVAILABLE = True
+            except ImportError:
+                pass
+            STARTUP_PHASES['vnstock'] = time.monotonic() - started
+
+            # Replay không cần vnstock (chỉ cần pandas để dựng lại DataFrame)
+            if UPSTREAM_ARCHIVE.mode == 'replay' and pd is not None:
+                VNSTOCK_AVAILABLE = BOARD_AVAILABLE = True
+        except Exception as e:
+            LOG.error('Lỗi nạp thư viện thị trường', error=str(e))
+        finally:
+            STARTUP_PHASES['market_ready'] = time.monotonic() - STARTUP_STARTED
+            self.ready.set()
+            LOG.info('Thư viện thị trường sẵn sàng', available=VNSTOCK_AVAILABLE, phases=startup_report())
+
+    def wait(self, timeout=MARKET_IMPORT_WAIT):
+        # Server được import như module (không qua __main__) thì nạp ở request API đầu tiên
+        if self.ready.is_set():
+            return True
+        self.start()
+        with timed('startup'):
+            return self.ready.wait(timeout)
+
+    def status(self):
+        return {"ready": self.ready.is_set(), "phases": startup_report()}
+
+
+def startup_report():
+    # Thread market-import có thể đang thêm giai đoạn mới: duyệt trên bản sao
+    return {name: round(seconds * 1000, 1) for name, seconds in list(STARTUP_PHASES.items())}
+
+
+MARKET_LOADER = MarketLoader()
+
+
+def quote_history(ticker, **kwargs):
+    return UPSTREAM_ARCHIVE.call('quote.history', [ticker, kwargs],
+                                 lambda: Quote(symbol=ticker, source='VCI').history(**kwargs), pack_frame, unpack_frame)
+
+
+def finance_ratio(ticker, period='year'):
+    return UPSTREAM_ARCHIVE.call('finance.ratio', [ticker, period],
+                                 lambda: Finance(symbol=ticker, source='VCI').ratio(period=period), pack_frame, unpack_frame)
+
+
+def price_board(symbols):
+    return UPSTREAM_ARCHIVE.call('trading.price_board', [sorted(symbols)],
+                                 lambda: Trading(source='VCI').price_board(symbols_list=symbols), pack_frame, unpack_frame)
+
+
+def route_of(path):
+    # Nhãn route cho metrics: giữ số nhãn cố định để không phình theo URL
+    path = urllib.parse.urlsplit(path).path
+    if path == '/metrics':
+        return 'metrics'
+    if path.startswith('/api/'):
+        return path[5:] if path[5:] in API_ROUTES else 'api-other'
+    return 'static'
+
+
+class CountingWriter:
+    # Bọc wfile để đếm số byte đã gửi cho metrics
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
 class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' if KEEPALIVE else 'HTTP/1.0'
+    # Timeout của socket: kết nối keep-alive rảnh quá lâu sẽ bị đóng, trả worker về pool
+    timeout = KEEPALIVE_TIMEOUT
+    # Header và body ghi thành 2 lần: bật TCP_NODELAY để Nagle + delayed ACK
+    # không giữ body lại ~40ms trên kết nối keep-alive
+    disable_nagle_algorithm = True
+    requests_served = 0
+    # True khi kết nối được chuyển sang hàng chờ rảnh thay vì đóng
+    parked = False
+    # (offset, length) của file thường đang gửi, copyfile dùng để sendfile/Range
+    file_range = None
+    # RequestTimings của request API đang xử lý (None với file tĩnh)
+    timings = None
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+        # Kết nối keep-alive quay lại từ hàng chờ rảnh: giữ số request đã phục vụ
+        resumed = getattr(self.server, 'resumed', None)
+        if resumed:
+            self.requests_served = resumed.pop(self.request, 0)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if self.park_if_idle():
+                return
+            self.handle_one_request()
+
+    def park_if_idle(self):
+        # Chưa có request tiếp theo: trả worker về pool, server giữ kết nối ở hàng chờ rảnh
+        if getattr(self.server, 'idle', None) is None:
+            return False
+        self.connection.setblocking(False)
+        try:
+            pending = self.rfile.peek(1)
+        except (OSError, ValueError):
+            pending = b''
+        finally:
+            self.connection.settimeout(self.timeout)
+        self.parked = not pending
+        return self.parked
+
+    def parse_request(self):
+        # Bắt đầu tính giờ khi đã đọc xong dòng request (không tính thời gian chờ keep-alive)
+        self.request_started = time.monotonic()
+        self.status_code = None
+        self.cache_status = None
+        self.timings = None
+        # HEAD không gọi copyfile nên range của request trước có thể còn sót trên kết nối keep-alive
+        self.file_range = None
+        self.bytes_before = self.wfile.bytes
+        METRICS.inc('http_requests_in_flight')
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self.requests_served += 1
+        self.request_started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started is not None:
+                self.record_request()
+
+    def record_request(self):
+        METRICS.inc('http_requests_in_flight', value=-1)
+        route = route_of(getattr(self, 'path', ''))
+        METRICS.inc('http_requests_total', (('route', route), ('code', self.status_code or 0)))
+        elapsed = time.monotonic() - self.request_started
+        METRICS.observe('http_request_duration_seconds', (('route', route),), elapsed)
+        METRICS.inc('http_response_bytes_total', (('route', route),), self.wfile.bytes - self.bytes_before)
+
+        # Request file tĩnh thành công chỉ ghi theo tỉ lệ mẫu, lỗi và API thì luôn ghi
+        if route == 'static' and (self.status_code or 0) < 400 and random.random() >= LOG_STATIC_SAMPLE:
+            return
+        LOG.info(
+            'access',
+            client=self.client_address[0],
+            method=self.command,
+            path=self.path,
+            route=route,
+            status=self.status_code,
+            ms=round(elapsed * 1000, 1),
+            bytes=self.wfile.bytes - self.bytes_before,
+            cache=self.cache_status,
+            # Gồm cả thời gian ghi body, phần không thể có trong header Server-Timing
+            timing=self.timings.snapshot() if self.timings is not None else None
+        )
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword == 'X-Cache':
+            self.cache_status = value
+        super().send_header(keyword, value)
+
+    def log_message(self, format, *args):
+        # Access log đã ghi có cấu trúc trong record_request, ở đây chỉ còn thông báo lỗi của http.server
+        LOG.debug(format % args, client=self.client_address[0])
+
+    def end_headers(self):
+        if self.request_version == 'HTTP/1.1' and not self.close_connection:
+            # Không có hàng chờ rảnh (SERVER_MODE=single): giữ kết nối sẽ chặn mọi client khác
+            if self.requests_served >= KEEPALIVE_MAX_REQUESTS or getattr(self.server, 'idle', None) is None:
+                self.send_header('Connection', 'close')
+            else:
+                remaining = KEEPALIVE_MAX_REQUESTS - self.requests_served
+                self.send_header('Keep-Alive', f'timeout={int(KEEPALIVE_TIMEOUT)}, max={remaining}')
+        super().end_headers()
+
     def do_OPTIONS(self):
         self.send_response(204)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_POST(self):
-        if self.path == '/api/youtube-search':
-            self.proxy_youtube_search()
+        if urllib.parse.urlsplit(self.path).path == '/api/youtube-search':
+            self.with_api_slot(self.proxy_youtube_search)
         else:
+            # Body chưa đọc nên không thể dùng lại kết nối
+            self.close_connection = True
             self.send_error(404, 'Not Found')
 
     def do_GET(self):
-        if self.path.startswith("/api/"):
-            self.handle_api()
+        if self.path == "/metrics":
+            self.send_metrics()
+        elif self.path.startswith("/api/stream"):
+            self.stream_quotes()
+        elif self.path.startswith("/api/"):
+            self.with_api_slot(self.handle_api)
         else:
             # Serve static files
             super().do_GET()
 
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and urllib.parse.urlsplit(self.path).path.endswith('/'):
+            for index in "index.html", "index.htm":
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+        if path.endswith('/') or not os.path.isfile(path):
+            # Redirect thư mục, liệt kê thư mục, 404: giữ nguyên xử lý gốc
+            return super().send_head()
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        ctype = self.guess_type(path)
+        range_header = self.headers.get('Range')
+        # Yêu cầu Range (seek audio/video) luôn trả bản gốc không nén
+        encoding = None if range_header else self.pick_encoding(ctype, st.st_size)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+        hashed = HASHED_ASSET.search(urllib.parse.urlsplit(self.path).path)
+        cache_control = 'public, max-age=31536000, immutable' if hashed else 'no-cache'
+
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.cache_status = 'REVALIDATED'
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return None
+
+        status = 200
+        if encoding:
+            key = (path, st.st_mtime_ns, st.st_size, encoding)
+            body, hit = STATIC_CACHE.get(key, lambda: compress(path, encoding))
+            f = io.BytesIO(body)
+            length = len(body)
+        else:
+            start, length = 0, st.st_size
+            if range_header and self.headers.get('If-Range', etag) == etag:
+                byte_range = parse_range(range_header, st.st_size)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{st.st_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return None
+                if byte_range != (0, st.st_size):
+                    status = 206
+                    start, length = byte_range
+            f = open(path, 'rb')
+            self.file_range = (start, length)
+
+        self.send_response(status)
+        self.send_header('Content-type', ctype)
+        self.send_header('Content-Length', str(length))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{start + length - 1}/{st.st_size}')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('X-Cache', 'HIT' if hit else 'MISS')
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        file_range, self.file_range = self.file_range, None
+        if file_range is None:
+            return super().copyfile(source, outputfile)
+
+        start, length = file_range
+        if length >= SENDFILE_MIN:
+            # Kernel gửi thẳng từ page cache ra socket, không qua buffer Python
+            self.wfile.bytes += self.connection.sendfile(source, start, length)
+            return
+        source.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+    def pick_encoding(self, ctype, size):
+        if size < STATIC_MIN_COMPRESS or not ctype.startswith(COMPRESSIBLE_TYPES):
+            return None
+        accepted = {}
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip().lower()] = q
+        if brotli is not None and accepted.get('br', 0) > 0:
+            return 'br'
+        if accepted.get('gzip', 0) > 0:
+            return 'gzip'
+        return None
+
+    def with_api_slot(self, handler):
+        # Giới hạn số API chạy cùng lúc, quá giới hạn thì trả 503 để client thử lại
+        if not API_SLOTS.acquire(blocking=False):
+            self.send_busy()
+            return
+        self.timings = begin_request()
+        try:
+            if PROFILER.wanted(self) and route_of(self.path) != 'profile':
+                PROFILER.run(route_of(self.path), handler)
+            else:
+                handler()
+        finally:
+            end_request()
+            API_SLOTS.release()
+
+    def send_busy(self):
+        body = json.dumps({'error': 'Server đang bận, vui lòng thử lại sau'}).encode('utf-8')
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(RETRY_AFTER))
+        if self.command == 'POST':
+            # Body của POST bị từ chối chưa được đọc
+            self.send_header('Connection', 'close')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
     def proxy_youtube_search(self):
         try:
             content_length = int(self.headers.get('Content-Length', 0))
@@ -63,78 +1308,152 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
             body = json.loads(post_data.decode('utf-8'))
             query = body.get('query', '')
 
-            print(f'🔍 YouTube search: {query}')
-
-            request_body = json.dumps({
-                'context': {
-                    'client': {
-                        'hl': 'vi',
-                        'gl': 'VN',
-                        'clientName': 'WEB',
-                        'clientVersion': '2.20240101.00.00'
-                    }
-                },
-                'query': query
-            }).encode('utf-8')
-
-            req = urllib.request.Request(
-                'https://www.youtube.com/youtubei/v1/search?prettyPrint=false',
-                data=request_body,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-            )
-
-            with urllib.request.urlopen(req, timeout=10) as response:
-                yt_data = json.loads(response.read().decode('utf-8'))
+            LOG.debug('YouTube search', query=query)
 
-            videos = []
-            try:
-                contents = yt_data.get('contents', {}).get('twoColumnSearchResultsRenderer', {}).get('primaryContents', {}).get('sectionListRenderer', {}).get('contents', [])
-                for section in contents:
-                    items = section.get('itemSectionRenderer', {}).get('contents', [])
-                    for item in items:
-                        video = item.get('videoRenderer')
-                        if video:
-                            video_id = video.get('videoId')
-                            title = video.get('title', {}).get('runs', [{}])[0].get('text', '')
-                            channel = video.get('ownerText', {}).get('runs', [{}])[0].get('text', '')
-                            if video_id and title:
-                                videos.append({
-                                    'id': video_id,
-                                    'videoId': video_id,
-                                    'url': f'https://www.youtube.com/watch?v={video_id}',
-                                    'title': title,
-                                    'thumbnail': f'https://img.youtube.com/vi/{video_id}/mqdefault.jpg',
-                                    'channel': channel
-                                })
-                                if len(videos) >= 20:
-                                    break
-                    if len(videos) >= 20:
-                        break
-            except Exception as e:
-                print(f'YouTube parse error: {e}')
+            cache_key = normalize_query(query)
+            with timed('cache'):
+                videos = YT_CACHE.get(cache_key)
+            cache_status = 'HIT' if videos is not None else 'MISS'
+            METRICS.inc('cache_requests_total', (('cache', 'youtube'), ('result', cache_status.lower())))
+            if videos is None:
+                videos = YT_BREAKER.call(self.search_youtube, query)
+                if videos:
+                    YT_CACHE.put(cache_key, videos)
 
-            result = json.dumps({'videos': videos, 'totalResults': len(videos)})
+            with timed('json'):
+                result = json.dumps({'videos': videos, 'totalResults': len(videos)}).encode('utf-8')
+            result = self.with_timing(result)
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(result)))
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Cache', cache_status)
+            self.send_server_timing()
             self.end_headers()
-            self.wfile.write(result.encode('utf-8'))
-            print(f'✅ Found {len(videos)} videos')
+            with timed('write'):
+                self.wfile.write(result)
+            LOG.info('YouTube search', query=query, videos=len(videos), cache=cache_status)
 
         except Exception as e:
-            print(f'❌ YouTube API error: {e}')
+            LOG.error('YouTube API error', error=str(e))
+            result = json.dumps({'error': str(e), 'videos': []}).encode('utf-8')
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(result)))
+            # Body request có thể chưa đọc hết (Content-Length sai, chunked...), không dùng lại kết nối
+            self.send_header('Connection', 'close')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_server_timing()
             self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e), 'videos': []}).encode('utf-8'))
+            self.wfile.write(result)
+
+    def search_youtube(self, query):
+        request_body = json.dumps({
+            'context': {
+                'client': {
+                    'hl': 'vi',
+                    'gl': 'VN',
+                    'clientName': 'WEB',
+                    'clientVersion': '2.20240101.00.00'
+                }
+            },
+            'query': query
+        }).encode('utf-8')
+
+        status, raw = UPSTREAM_ARCHIVE.call('youtube.search', [normalize_query(query)], lambda: YT_POOL.request(
+            'POST',
+            '/youtubei/v1/search?prettyPrint=false',
+            body=request_body,
+            headers={
+                'Content-Type': 'application/json',
+                'Accept-Encoding': 'gzip',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            }
+        ), lambda r: [r[0], r[1].decode('utf-8', 'surrogateescape')],
+           lambda v: (v[0], v[1].encode('utf-8', 'surrogateescape')))
+        if status != 200:
+            raise RuntimeError(f'YouTube trả về HTTP {status}')
+        with timed('json'):
+            yt_data = json.loads(raw.decode('utf-8'))
+
+        videos = []
+        try:
+            contents = yt_data.get('contents', {}).get('twoColumnSearchResultsRenderer', {}).get('primaryContents', {}).get('sectionListRenderer', {}).get('contents', [])
+            for section in contents:
+                items = section.get('itemSectionRenderer', {}).get('contents', [])
+                for item in items:
+                    video = item.get('videoRenderer')
+                    if video:
+                        video_id = video.get('videoId')
+                        title = video.get('title', {}).get('runs', [{}])[0].get('text', '')
+                        channel = video.get('ownerText', {}).get('runs', [{}])[0].get('text', '')
+                        if video_id and title:
+                            videos.append({
+                                'id': video_id,
+                                'videoId': video_id,
+                                'url': f'https://www.youtube.com/watch?v={video_id}',
+                                'title': title,
+                                'thumbnail': f'https://img.youtube.com/vi/{video_id}/mqdefault.jpg',
+                                'channel': channel
+                            })
+                            if len(videos) >= 20:
+                                break
+                if len(videos) >= 20:
+                    break
+        except Exception as e:
+            LOG.warning('YouTube parse error', error=str(e))
+        return videos
+
+    def stream_quotes(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        query_params = urllib.parse.parse_qs(parsed_path.query)
+        tickers = query_params.get('tickers', [''])[0]
+        symbols = list(dict.fromkeys(t for t in tickers.split(',') if t))
+        if not symbols:
+            self.send_error(400, 'Thiếu tickers')
+            return
+        if not STREAM_SLOTS.acquire(blocking=False):
+            self.send_busy()
+            return
+
+        q = None
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            # SSE không có Content-Length: kết thúc bằng cách đóng kết nối
+            self.send_header('Connection', 'close')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+
+            # Gửi ảnh chụp đầy đủ ngay, sau đó chỉ gửi các mã thay đổi
+            snapshot = self.get_board(','.join(symbols))
+            self.send_event(snapshot)
+            q = QUOTE_STREAM.subscribe(symbols, self.get_board, snapshot)
+            while True:
+                try:
+                    changed = q.get(timeout=STREAM_HEARTBEAT)
+                    self.send_event({"data": changed})
+                except queue.Empty:
+                    self.wfile.write(b': ping\n\n')
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if q is not None:
+                QUOTE_STREAM.unsubscribe(q)
+            STREAM_SLOTS.release()
+
+    def send_event(self, data):
+        self.wfile.write(b'data: ' + json.dumps(data).encode() + b'\n\n')
+        self.wfile.flush()
 
     def handle_api(self):
         parsed_path = urllib.parse.urlparse(self.path)
         query_params = urllib.parse.parse_qs(parsed_path.query)
+        if parsed_path.path not in ("/api/status", "/api/profile"):
+            # Vừa khởi động: chờ ngắn cho pandas/vnstock nạp xong
+            MARKET_LOADER.wait()
 
         try:
             if parsed_path.path == "/api/quote":
@@ -142,9 +1461,36 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
                 data = self.get_latest_prices(tickers)
                 self.send_json(data)
 
+            elif parsed_path.path == "/api/board":
+                tickers = query_params.get('tickers', [''])[0]
+                data = self.get_board(tickers)
+                self.send_json(data)
+
+            elif parsed_path.path == "/api/dashboard":
+                ticker = query_params.get('ticker', [''])[0]
+                tickers = query_params.get('tickers', [ticker])[0]
+                data = self.get_dashboard(ticker, tickers)
+                self.send_json(data)
+
+            elif parsed_path.path == "/api/status":
+                self.send_json(self.get_status())
+
+            elif parsed_path.path == "/api/profile":
+                # Tên hàm/đường dẫn file chỉ cho xem từ máy local
+                if self.client_address[0] not in LOCAL_ADDRESSES:
+                    self.send_error(403)
+                else:
+                    self.send_json(PROFILER.summary(query_params.get('sort', ['tottime'])[0]))
+
             elif parsed_path.path == "/api/history":
                 ticker = query_params.get('ticker', [''])[0]
-                data = self.get_history(ticker)
+                count = parse_count(query_params.get('count', [None])[0])
+                data = self.get_history(ticker, count)
+                self.send_json(data)
+
+            elif parsed_path.path == "/api/stats/batch":
+                tickers = query_params.get('tickers', [''])[0]
+                data = self.get_stats_table(tickers)
                 self.send_json(data)
 
             elif parsed_path.path == "/api/stats":
@@ -154,39 +1500,137 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
             else:
                 self.send_error(404)
         except Exception as e:
-            print(f"Lỗi API: {e}")
+            LOG.error("Lỗi API", path=self.path, error=str(e))
             self.send_error(500, str(e))
 
     def get_latest_prices(self, tickers):
         if VNSTOCK_AVAILABLE:
-            results = []
-            for t in tickers.split(','):
+            ttl = quote_ttl()
+            symbols = list(dict.fromkeys(t for t in tickers.split(',') if t))
+            quotes, errors = self.fetch_quotes(symbols, ttl)
+            results = [quotes[t] for t in symbols if t in quotes]
+
+            if results:
+                data = {"data": results, "source": "vnstock (VCI)", "cacheTtl": ttl}
+                if errors:
+                    data["errors"] = errors
+                return data
+
+        return self.fallback_prices(tickers)
+
+    def get_board(self, tickers):
+        if not (VNSTOCK_AVAILABLE and BOARD_AVAILABLE):
+            return self.get_latest_prices(tickers)
+
+        ttl = quote_ttl()
+        symbols = list(dict.fromkeys(t for t in tickers.split(',') if t))
+        quotes = {}
+        for t in symbols:
+            hit = QUOTE_CACHE.peek(t, ttl)
+            if hit and hit[0]:
+                quotes[t] = dict(hit[0], cacheAge=round(hit[1], 1))
+
+        # Các mã chưa có trong cache: 1 lần gọi price board cho tất cả
+        missing = [t for t in symbols if t not in quotes]
+        if missing:
+            try:
+                for t, quote in VCI_BREAKER.call(self.fetch_board, missing).items():
+                    QUOTE_CACHE.put(t, quote)
+                    quotes[t] = dict(quote, cacheAge=0.0)
+            except Exception as e:
+                LOG.warning("Lỗi lấy bảng giá", error=str(e))
+
+        # Mã không có trên bảng giá thì mới lấy riêng từng mã qua Quote.history
+        errors = {}
+        rest = [t for t in symbols if t not in quotes]
+        if rest:
+            fetched, errors = self.fetch_quotes(rest, ttl)
+            quotes.update(fetched)
+
+        results = [quotes[t] for t in symbols if t in quotes]
+        if not results:
+            return self.fallback_prices(tickers)
+        data = {"data": results, "source": "vnstock (VCI board)", "cacheTtl": ttl}
+        if errors:
+            data["errors"] = errors
+        return data
+
+    def fetch_quotes(self, symbols, ttl):
+        # Lấy giá từng mã song song, trả về (quotes theo mã, lỗi theo mã)
+        futures = {
+            t: UPSTREAM_EXECUTOR.submit(PROFILER.wrap(QUOTE_CACHE.get), t, lambda t=t: VCI_BREAKER.call(self.fetch_quote, t), ttl)
+            for t in symbols
+        }
+        # Chờ tối đa QUOTE_DEADLINE giây, mã nào chưa xong thì trả về phần đã có
+        with timed('upstream'):
+            wait(futures.values(), timeout=QUOTE_DEADLINE)
+
+        quotes = {}
+        errors = {}
+        for t, future in futures.items():
+            if not future.done():
+                # Còn nằm trong hàng đợi thì bỏ luôn, không giữ worker sau khi request đã trả về
+                future.cancel()
+                errors[t] = f"quá thời gian {QUOTE_DEADLINE}s"
+            else:
                 try:
-                    q = Quote(symbol=t, source='VCI')
-                    df = q.history(count_back=2)
-                    if not df.empty:
-                        last = df.iloc[-1]
-                        prev = df.iloc[-2] if len(df) > 1 else last
-
-                        price = float(last['close'])
-                        ref = float(prev['close'])
-                        change_percent = (price - ref) / ref if ref != 0 else 0
-
-                        results.append({
-                            "ticker": t,
-                            "price": price * 1000,
-                            "basicPrice": ref * 1000,
-                            "dayChangePercent": change_percent
-                        })
+                    quote, age = future.result()
+                    if quote:
+                        quotes[t] = dict(quote, cacheAge=round(age, 1))
+                    else:
+                        errors[t] = "không có dữ liệu"
                 except Exception as e:
-                    print(f"Lỗi lấy giá cho {t}: {e}")
+                    LOG.warning("Lỗi lấy giá", ticker=t, error=str(e))
+                    errors[t] = str(e)
 
-            if results:
-                return {"data": results, "source": "vnstock (VCI)"}
+            # Upstream lỗi/chậm/đang ngắt mạch: dùng giá cũ trong cache nếu có
+            stale = QUOTE_CACHE.peek(t, float('inf')) if t in errors else None
+            if stale and stale[0]:
+                quotes[t] = dict(stale[0], cacheAge=round(stale[1], 1), stale=True)
+        return quotes, errors
 
-        # Fallback
+    def fetch_board(self, symbols):
+        df = price_board(symbols)
+        if df is None or df.empty:
+            return {}
+        with timed('dataframe'):
+            # Cột của price board là MultiIndex (nhóm, tên), chỉ giữ tên
+            if getattr(df.columns, 'nlevels', 1) > 1:
+                df.columns = [c[-1] for c in df.columns]
+                df = df.loc[:, ~df.columns.duplicated()]
+
+            def to_vnd(v):
+                # Bảng giá trả về VND, history trả về nghìn VND
+                v = float(v or 0)
+                return v * 1000 if 0 < v < 1000 else v
+
+            board = {}
+            for rec in df.to_dict('records'):
+                t = rec.get('symbol')
+                ref = to_vnd(rec.get('ref_price'))
+                price = to_vnd(rec.get('match_price')) or ref
+                if not t or not price:
+                    continue
+                board[t] = {
+                    "ticker": t,
+                    "price": price,
+                    "basicPrice": ref,
+                    "dayChangePercent": (price - ref) / ref if ref else 0
+                }
+            return board
+
+    def fallback_prices(self, tickers):
         results = []
         for t in tickers.split(','):
+            if SIM_MARKET is not None:
+                price, ref = SIM_MARKET.quote(t)
+                results.append({
+                    "ticker": t,
+                    "price": price * 1000,
+                    "basicPrice": ref * 1000,
+                    "dayChangePercent": (price - ref) / ref
+                })
+                continue
             base = BASE_PRICES.get(t, 50.0)
             change = random.uniform(-0.02, 0.02)
             price = base * (1 + change)
@@ -198,35 +1642,54 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
             })
         return {"data": results, "source": "giả lập (fallback)"}
 
-    def get_history(self, ticker):
+    def fetch_quote(self, t):
+        df = quote_history(t, count_back=2)
+        if df.empty:
+            return None
+        with timed('dataframe'):
+            last = df.iloc[-1]
+            prev = df.iloc[-2] if len(df) > 1 else last
+            price = float(last['close'])
+            ref = float(prev['close'])
+        change_percent = (price - ref) / ref if ref != 0 else 0
+
+        return {
+            "ticker": t,
+            "price": price * 1000,
+            "basicPrice": ref * 1000,
+            "dayChangePercent": change_percent
+        }
+
+    def get_history(self, ticker, count=HISTORY_BARS):
         if VNSTOCK_AVAILABLE:
             try:
-                q = Quote(symbol=ticker, source='VCI')
-                df = q.history(count_back=100)
-
-                data = []
-                time_col = 'time' if 'time' in df.columns else (df.index.name if df.index.name else 'time')
-
-                if time_col not in df.columns and time_col != df.index.name:
-                    df = df.reset_index()
-                    time_col = 'time' if 'time' in df.columns else df.columns[0]
-
-                for _, row in df.iterrows():
-                    data.append({
-                        "tradingDate": str(row[time_col]),
-                        "close": float(row['close']) * 1000
-                    })
-                return {"data": data, "source": "vnstock (VCI)"}
+                if HISTORY_STORE.enabled(ticker):
+                    bars = self.synced_history(ticker, count)
+                else:
+                    df = VCI_BREAKER.call(lambda: quote_history(ticker, count_back=count))
+                    bars = HISTORY_STORE.from_frame(df)
+                return {"data": history_records(bars[-count:]), "source": "vnstock (VCI)"}
             except Exception as e:
-                print(f"Lỗi lịch sử cho {ticker}: {e}")
+                LOG.warning("Lỗi lịch sử", ticker=ticker, error=str(e))
+                # Upstream lỗi thì trả dữ liệu đã lưu trên đĩa (nếu có)
+                bars = HISTORY_STORE.load(ticker) if HISTORY_STORE.enabled(ticker) else None
+                if bars is not None and len(bars):
+                    return {"data": history_records(bars[-count:]), "source": "vnstock (VCI, lưu trữ)"}
+        elif not MARKET_LOADER.ready.is_set() and np is not None and ticker.isalnum():
+            # Đang nạp vnstock: dùng lịch sử đã lưu trên đĩa nếu có
+            bars = HISTORY_STORE.load(ticker)
+            if bars is not None and len(bars) >= count:
+                return {"data": history_records(bars[-count:]), "source": "vnstock (VCI, lưu trữ)"}
 
         # Fallback
+        if SIM_MARKET is not None:
+            return {"data": SIM_MARKET.history(ticker, count), "source": "giả lập"}
         data = []
         base = BASE_PRICES.get(ticker, 50.0)
         curr = base
         now = datetime.now()
-        for i in range(100):
-            d = now - timedelta(days=i)
+        d = now
+        while len(data) < count:
             if d.weekday() < 5:
                 change = random.uniform(-0.03, 0.03)
                 curr = curr * (1 + change)
@@ -234,57 +1697,225 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
                     "tradingDate": d.strftime("%Y-%m-%dT00:00:00Z"),
                     "close": curr * 1000
                 })
+            d -= timedelta(days=1)
         return {"data": data, "source": "giả lập"}
 
-    def get_stats(self, ticker):
-        if VNSTOCK_AVAILABLE:
-            try:
-                f = Finance(symbol=ticker, source='VCI')
-                df = f.ratio(period='year')
-                if not df.empty:
-                    latest = df.iloc[-1]
-                    stats = {}
+    def synced_history(self, ticker, count):
+        depth = max(count, HISTORY_DEPTH.get(ticker, 0))
+        HISTORY_DEPTH[ticker] = depth
 
-                    def get_val(lvl1, lvl2):
-                        try:
-                            return float(latest[(lvl1, lvl2)])
-                        except:
-                            return None
+        def load():
+            return VCI_BREAKER.call(self.sync_history, ticker, depth), depth
+
+        synced, _ = HISTORY_CACHE.get(ticker, load, quote_ttl())
+        if synced[1] < count:
+            # Bản đồng bộ còn hạn nhưng ít phiên hơn yêu cầu: đồng bộ lại với depth mới
+            HISTORY_CACHE.discard(ticker, synced)
+            synced, _ = HISTORY_CACHE.get(ticker, load, quote_ttl())
+        return synced[0]
 
-                    stats['pe'] = get_val('Chỉ tiêu định giá', 'P/E')
-                    stats['pb'] = get_val('Chỉ tiêu định giá', 'P/B')
-                    stats['roe'] = get_val('Chỉ tiêu hiệu quả hoạt động', 'ROE')
-                    stats['marketCap'] = get_val('Chỉ tiêu định giá', 'Market Capital (Bn. VND)')
-                    stats['eps'] = get_val('Chỉ tiêu định giá', 'EPS (VND)')
+    def sync_history(self, ticker, count=HISTORY_BARS):
+        # Lần đầu (hoặc khi cần nhiều phiên hơn đã lưu) tải đủ count phiên,
+        # các lần sau chỉ tải từ phiên cuối đã lưu
+        stored = HISTORY_STORE.load(ticker)
+        if stored is None or len(stored) < count:
+            df = quote_history(ticker, count_back=count)
+        else:
+            start = str(stored['time'][-1])
+            end = datetime.now(VN_TZ).strftime('%Y-%m-%d')
+            df = quote_history(ticker, start=start, end=end, interval='1D')
+        return HISTORY_STORE.append(ticker, HISTORY_STORE.from_frame(df))
 
-                    return {"data": stats, "source": "vnstock (VCI)"}
+    def get_stats(self, ticker):
+        if VNSTOCK_AVAILABLE:
+            try:
+                stats, age = STATS_CACHE.get(f"{ticker}:year", lambda: VCI_BREAKER.call(self.fetch_stats, ticker), STATS_TTL)
+                if stats:
+                    return {
+                        "data": stats['data'],
+                        "fiscalYear": stats.get('fiscalYear'),
+                        "source": "vnstock (VCI)",
+                        "cacheAge": round(age)
+                    }
             except Exception as e:
-                print(f"Lỗi lấy stats cho {ticker}: {e}")
+                LOG.warning("Lỗi lấy stats", ticker=ticker, error=str(e))
+        elif not MARKET_LOADER.ready.is_set():
+            # Đang nạp vnstock: trả bản đã lưu trên đĩa dù đã cũ
+            hit = STATS_CACHE.peek(f"{ticker}:year", float('inf'))
+            if hit and hit[0]:
+                stats, age = hit
+                return {
+                    "data": stats['data'],
+                    "fiscalYear": stats.get('fiscalYear'),
+                    "source": "vnstock (VCI, lưu trữ)",
+                    "cacheAge": round(age)
+                }
 
-        # Fallback
+        # Fallback: seed theo mã để các lần gọi trả cùng một bộ chỉ số
+        rng = random.Random(zlib.crc32(ticker.upper().encode()))
         return {
             "data": {
-                "pe": random.uniform(8, 20),
-                "pb": random.uniform(0.8, 3.0),
-                "roe": random.uniform(0.1, 0.25),
-                "marketCap": random.randint(10000, 500000),
-                "eps": random.randint(2000, 8000)
+                "pe": rng.uniform(8, 20),
+                "pb": rng.uniform(0.8, 3.0),
+                "roe": rng.uniform(0.1, 0.25),
+                "marketCap": rng.randint(10000, 500000),
+                "eps": rng.randint(2000, 8000)
             },
             "source": "giả lập"
         }
 
+    def get_status(self):
+        return {
+            "vnstock": VNSTOCK_AVAILABLE,
+            "startup": MARKET_LOADER.status(),
+            "upstream": UPSTREAM_ARCHIVE.status(),
+            "breakers": {b.name: b.status() for b in (VCI_BREAKER, YT_BREAKER)}
+        }
+
+    def get_dashboard(self, ticker, tickers):
+        # Gộp quote (cả watchlist), stats và history của mã đang chọn trong 1 request
+        symbols = list(dict.fromkeys(t for t in [ticker] + tickers.split(',') if t))
+        parts = {"quotes": DASHBOARD_EXECUTOR.submit(PROFILER.wrap(self.get_board), ','.join(symbols))}
+        if ticker:
+            parts["stats"] = DASHBOARD_EXECUTOR.submit(PROFILER.wrap(self.get_stats), ticker)
+            parts["history"] = DASHBOARD_EXECUTOR.submit(PROFILER.wrap(self.get_history), ticker)
+
+        with timed('upstream'):
+            wait(parts.values(), timeout=DASHBOARD_DEADLINE)
+        data = {"ticker": ticker}
+        errors = {}
+        for name, future in parts.items():
+            if not future.done():
+                future.cancel()
+                errors[name] = f"quá thời gian {DASHBOARD_DEADLINE}s"
+                continue
+            try:
+                data[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+        if errors:
+            data["errors"] = errors
+        return data
+
+    def get_stats_table(self, tickers):
+        # Bảng chỉ số nhiều mã: mã có trong cache trả ngay, mã chưa có lấy song song
+        symbols = list(dict.fromkeys(t for t in tickers.split(',') if t))
+        results = {}
+        futures = {}
+        for t in symbols:
+            if VNSTOCK_AVAILABLE and STATS_CACHE.peek(f"{t}:year", float('inf')) is None:
+                futures[t] = UPSTREAM_EXECUTOR.submit(PROFILER.wrap(self.get_stats), t)
+            else:
+                results[t] = self.get_stats(t)
+
+        with timed('upstream'):
+            wait(futures.values(), timeout=QUOTE_DEADLINE)
+        errors = {}
+        for t, future in futures.items():
+            if future.done():
+                results[t] = future.result()
+            else:
+                future.cancel()
+                errors[t] = f"quá thời gian {QUOTE_DEADLINE}s"
+
+        # Dạng cột x mã: data['pe'][i] là P/E của tickers[i]
+        table = {
+            "tickers": symbols,
+            "columns": list(STATS_FIELDS),
+            "data": {c: [results[t]['data'].get(c) if t in results else None for t in symbols] for c in STATS_FIELDS},
+            "source": [results[t]['source'] if t in results else None for t in symbols]
+        }
+        if errors:
+            table["errors"] = errors
+        return table
+
+    def fetch_stats(self, ticker):
+        # Chỉ giữ 5 chỉ số của năm gần nhất, bỏ DataFrame nhiều năm ngay sau khi đọc
+        df = finance_ratio(ticker, 'year')
+        if df.empty:
+            return None
+        latest = df.iloc[-1]
+
+        def get_val(lvl1, lvl2):
+            try:
+                v = float(latest[(lvl1, lvl2)])
+                return v if v == v else None  # NaN -> None
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        with timed('dataframe'):
+            fiscal_year = get_val('Meta', 'Năm')
+            return {
+                "data": {
+                    "pe": get_val('Chỉ tiêu định giá', 'P/E'),
+                    "pb": get_val('Chỉ tiêu định giá', 'P/B'),
+                    "roe": get_val('Chỉ tiêu hiệu quả hoạt động', 'ROE'),
+                    "marketCap": get_val('Chỉ tiêu định giá', 'Market Capital (Bn. VND)'),
+                    "eps": get_val('Chỉ tiêu định giá', 'EPS (VND)')
+                },
+                "fiscalYear": int(fiscal_year) if fiscal_year else None
+            }
+
+    def send_metrics(self):
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def send_json(self, data):
+        with timed('json'):
+            body = json.dumps(data).encode()
+        body = self.with_timing(body)
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_server_timing()
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        with timed('write'):
+            self.wfile.write(body)
+
+    def with_timing(self, body):
+        # ?timing=1: chèn khối "_timing" vào cuối object JSON đã encode, không encode lại
+        if self.timings is None or 'timing=1' not in self.path or not body.endswith(b'}'):
+            return body
+        if urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get('timing') != ['1']:
+            return body
+        sep = b'' if body == b'{}' else b', '
+        return body[:-1] + sep + b'"_timing": ' + json.dumps(self.timings.snapshot()).encode() + b'}'
+
+    def send_server_timing(self):
+        if self.timings is not None:
+            self.send_header('Server-Timing', self.timings.header())
+            self.send_header('Timing-Allow-Origin', '*')
+
+
+def make_server():
+    if SERVER_MODE == 'single':
+        socketserver.TCPServer.allow_reuse_address = True
+        return socketserver.TCPServer((HOST, PORT), UnifiedHandler)
+    return PooledHTTPServer((HOST, PORT), UnifiedHandler, MAX_WORKERS, MAX_QUEUED,
+                            keepalive_timeout=KEEPALIVE_TIMEOUT if KEEPALIVE else None,
+                            max_idle=MAX_IDLE_CONNECTIONS, retry_after=RETRY_AFTER, metrics=METRICS)
+
 
-print(f"Server tích hợp (Web + Stock API) đang chạy tại: http://{HOST}:{PORT}")
-print(f"- Trang chính: http://localhost:{PORT}")
-print(f"- Stock App: http://localhost:{PORT}/stock/")
-print(f"- API: http://localhost:{PORT}/api/quote?tickers=VIC")
+if __name__ == "__main__":
+    print(f"Server tích hợp (Web + Stock API) đang chạy tại: http://{HOST}:{PORT}")
+    print(f"- Trang chính: http://localhost:{PORT}")
+    print(f"- Stock App: http://localhost:{PORT}/stock/")
+    print(f"- API: http://localhost:{PORT}/api/quote?tickers=VIC")
+    print(f"- Chế độ: {SERVER_MODE} (workers={MAX_WORKERS}, api={MAX_API_INFLIGHT})")
 
-socketserver.TCPServer.allow_reuse_address = True
-with socketserver.TCPServer((HOST, PORT), UnifiedHandler) as httpd:
-    httpd.serve_forever()
+    if UPSTREAM_ARCHIVE.mode != 'live':
+        print(f"- Upstream: {UPSTREAM_ARCHIVE.mode} ({UPSTREAM_ARCHIVE.path})")
+    if UPSTREAM_ARCHIVE.mode != 'replay':
+        threading.Thread(target=YT_POOL.warm_up, name='yt-warm-up', daemon=True).start()
+    started = time.monotonic()
+    with make_server() as httpd:
+        STARTUP_PHASES['bind'] = time.monotonic() - started
+        STARTUP_PHASES['serving'] = time.monotonic() - STARTUP_STARTED
+        print(f"- Khởi động: {startup_report()} ms, đang nạp pandas/vnstock ở nền")
+        MARKET_LOADER.start()
+        httpd.serve_forever()
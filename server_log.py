@@ -0,0 +1,89 @@
+"""Log có cấu trúc (JSON hoặc text) không chặn thread xử lý request, dùng cho server.py."""
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+VN_TZ = timezone(timedelta(hours=7))
+
+
+class AsyncLogger:
+    """Logger không chặn: put vào queue, thread nền ghi ra stream theo lô."""
+
+    def __init__(self, stream, level='info', fmt='json', batch_size=256, maxsize=10000, tz=VN_TZ):
+        self.stream = stream
+        self.tz = tz
+        self.level = LOG_LEVELS.get(level, 20)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name='logger', daemon=True)
+        self.thread.start()
+
+    def log(self, level, msg, **fields):
+        if LOG_LEVELS[level] < self.level:
+            return
+        try:
+            self.queue.put_nowait((time.time(), level, msg, fields))
+        except queue.Full:
+            # Không bao giờ chặn request vì log, chỉ đếm số dòng bị bỏ
+            self.dropped += 1
+
+    def debug(self, msg, **fields):
+        self.log('debug', msg, **fields)
+
+    def info(self, msg, **fields):
+        self.log('info', msg, **fields)
+
+    def warning(self, msg, **fields):
+        self.log('warning', msg, **fields)
+
+    def error(self, msg, **fields):
+        self.log('error', msg, **fields)
+
+    def format(self, record):
+        ts, level, msg, fields = record
+        stamp = datetime.fromtimestamp(ts, self.tz).isoformat(timespec='milliseconds')
+        if self.fmt == 'json':
+            return json.dumps({'ts': stamp, 'level': level, 'msg': msg, **fields}, ensure_ascii=False, default=str)
+        extra = ' '.join(f'{k}={v}' for k, v in fields.items())
+        return f'{stamp} {level.upper()} {msg} {extra}'.rstrip()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self.write(batch)
+                    return
+                batch.append(record)
+            self.write(batch)
+
+    def write(self, batch):
+        lines = [self.format(r) for r in batch]
+        if self.dropped:
+            lines.append(self.format((time.time(), 'warning', 'log bị bỏ do queue đầy', {'dropped': self.dropped})))
+            self.dropped = 0
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        # Ghi nốt log còn trong queue khi thoát
+        try:
+            self.queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self.thread.join(timeout=2)
@@ -0,0 +1,79 @@
+"""Counter/histogram kiểu Prometheus cho /metrics của server.py."""
+import bisect
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Counter/histogram ghi vào shard riêng của từng thread (không cần lock trên đường
+    request), chỉ cộng dồn các shard khi có người đọc /metrics."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []                 # [(thread, shard)]
+        self.retired = defaultdict(float)  # shard của các thread đã kết thúc
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = defaultdict(float)
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        self.shard()[(name, labels)] += value
+
+    def observe(self, name, labels, seconds):
+        shard = self.shard()
+        shard[(name + '_bucket', labels + (('le', bisect.bisect_left(LATENCY_BUCKETS, seconds)),))] += 1
+        shard[(name + '_sum', labels)] += seconds
+        shard[(name + '_count', labels)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            totals = defaultdict(float, self.retired)
+            alive = []
+            for thread, shard in self.shards:
+                # dict(shard) copy trong một bước dưới GIL nên không cần khoá thread ghi
+                target = totals if thread.is_alive() else self.retired
+                for key, value in dict(shard).items():
+                    target[key] += value
+                    if target is self.retired:
+                        totals[key] += value
+                if thread.is_alive():
+                    alive.append((thread, shard))
+            self.shards = alive
+        return totals
+
+    def render(self):
+        totals = self.snapshot()
+        lines = []
+
+        def fmt(labels):
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}' if labels else ''
+
+        histograms = defaultdict(lambda: [0.0] * (len(LATENCY_BUCKETS) + 1))
+        hits = defaultdict(lambda: [0.0, 0.0])
+        for (name, labels), value in sorted(totals.items()):
+            if name.endswith('_bucket'):
+                histograms[(name, labels[:-1])][labels[-1][1]] += value
+                continue
+            if name == 'cache_requests_total':
+                cache = dict(labels)
+                hits[cache['cache']][0 if cache['result'] == 'miss' else 1] += value
+            lines.append(f'{name}{fmt(labels)} {value:g}')
+
+        for (name, labels), counts in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{name}{fmt(labels + (("le", bound),))} {cumulative:g}')
+
+        for cache, (misses, hit) in sorted(hits.items()):
+            if misses + hit:
+                lines.append(f'cache_hit_ratio{fmt((("cache", cache),))} {hit / (misses + hit):.4f}')
+        return '\n'.join(lines) + '\n'
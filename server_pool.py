@@ -0,0 +1,161 @@
+"""TCPServer chạy trên thread pool có giới hạn cho server.py; kết nối keep-alive đang rảnh
+được giữ ở selector riêng thay vì chiếm worker."""
+import selectors
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IdleConnections:
+    """Giữ kết nối keep-alive đang rảnh ngoài pool worker, có request mới thì trả lại pool."""
+
+    def __init__(self, server, timeout, limit, metrics=None):
+        self.server = server
+        self.timeout = timeout
+        self.limit = limit
+        self.metrics = metrics
+        self.selector = selectors.DefaultSelector()
+        # Thread khác không đăng ký trực tiếp vào selector: xếp vào pending rồi đánh thức
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.conns = {}   # socket -> (client_address, requests_served, parked_at)
+        self.closed = False
+        threading.Thread(target=self.run, name='http-idle', daemon=True).start()
+
+    def park(self, request, client_address, served):
+        with self.lock:
+            self.pending.append((request, client_address, served))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except OSError:
+            pass
+
+    def run(self):
+        last_sweep = time.monotonic()
+        while not self.closed:
+            for key, _ in self.selector.select(timeout=1.0):
+                if key.fileobj is self.wake_r:
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                self.release(key.fileobj, resume=True)
+
+            now = time.monotonic()
+            with self.lock:
+                pending, self.pending = self.pending, []
+            for request, client_address, served in pending:
+                if len(self.conns) >= self.limit:
+                    self.server.shutdown_request(request)
+                    continue
+                try:
+                    self.selector.register(request, selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    self.server.shutdown_request(request)
+                    continue
+                self.conns[request] = (client_address, served, now)
+                self.gauge(1)
+
+            # Đóng kết nối rảnh quá timeout
+            if now - last_sweep >= 1.0:
+                last_sweep = now
+                for request, (_, _, parked_at) in list(self.conns.items()):
+                    if now - parked_at > self.timeout:
+                        self.release(request, resume=False)
+
+        for request in list(self.conns):
+            self.release(request, resume=False)
+
+    def release(self, request, resume):
+        client_address, served, _ = self.conns.pop(request)
+        self.gauge(-1)
+        try:
+            self.selector.unregister(request)
+        except (KeyError, ValueError):
+            pass
+        if resume:
+            self.server.resume(request, client_address, served)
+        else:
+            self.server.shutdown_request(request)
+
+    def gauge(self, delta):
+        if self.metrics is not None:
+            self.metrics.inc('http_connections_idle', value=delta)
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+
+class PooledHTTPServer(socketserver.TCPServer):
+    """TCPServer xử lý mỗi kết nối trên một thread pool có giới hạn."""
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, max_workers=32, max_queued=64, keepalive_timeout=None,
+                 max_idle=1000, retry_after=2, metrics=None):
+        super().__init__(server_address, handler_class)
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http')
+        # Tổng số kết nối đang chạy + đang chờ, vượt quá thì từ chối ngay
+        self.slots = threading.BoundedSemaphore(max_workers + max_queued)
+        # Kết nối keep-alive rảnh không giữ worker; socket -> số request đã phục vụ khi quay lại
+        # keepalive_timeout=None: không keep-alive, không cần hàng chờ
+        self.idle = IdleConnections(self, keepalive_timeout, max_idle, metrics) if keepalive_timeout else None
+        self.resumed = {}
+
+    def resume(self, request, client_address, served):
+        self.resumed[request] = served
+        self.process_request(request, client_address)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        try:
+            self.executor.submit(self.process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor đã shutdown
+            self.slots.release()
+            self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.slots.release()
+            if handler is not None and getattr(handler, 'parked', False):
+                self.idle.park(request, client_address, handler.requests_served)
+            else:
+                self.resumed.pop(request, None)
+                self.shutdown_request(request)
+
+    def reject_request(self, request):
+        try:
+            request.sendall(
+                b'HTTP/1.0 503 Service Unavailable\r\n'
+                b'Retry-After: ' + str(self.retry_after).encode() + b'\r\n'
+                b'Content-Length: 0\r\n'
+                b'Connection: close\r\n\r\n'
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if self.idle is not None:
+            self.idle.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+"""Profile cProfile theo mẫu cho request của server.py: lưu file .prof và tổng hợp hàm tốn thời gian."""
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1', '::ffff:127.0.0.1'}
+
+
+class RequestProfiler:
+    """Profile cProfile cho một phần request, gộp cả phần việc đẩy sang thread pool."""
+
+    def __init__(self, directory, sample, keep, top=25, log=None, metrics=None):
+        self.directory = directory
+        self.log = log
+        self.metrics = metrics
+        self.sample = sample
+        self.keep = keep
+        self.top = top
+        self.local = threading.local()
+        # Python 3.12+ chỉ cho 1 profiler hoạt động tại một thời điểm: profile lần lượt từng request
+        self.active = threading.Lock()
+        self.lock = threading.Lock()
+        self.totals = {}          # (file, line, hàm) -> [calls, tottime, cumtime]
+        self.routes = defaultdict(int)
+        self.recent = []          # [(file, route, ms)] mới nhất ở cuối
+
+    def wanted(self, handler):
+        if handler.headers.get('X-Profile') == '1' and handler.client_address[0] in LOCAL_ADDRESSES:
+            return True
+        return self.sample > 0 and random.random() < self.sample
+
+    def run(self, route, fn):
+        if not self.active.acquire(blocking=False):
+            return fn()
+        profiles = []
+        prof = cProfile.Profile()
+        self.local.profiles = profiles
+        started = time.perf_counter()
+        try:
+            prof.enable()
+            try:
+                return fn()
+            finally:
+                prof.disable()
+        finally:
+            self.local.profiles = None
+            self.active.release()
+            self.save(route, [prof] + profiles, time.perf_counter() - started)
+
+    def wrap(self, fn):
+        # Phần việc đẩy sang thread pool cũng được profile nếu request gốc đang được profile
+        profiles = getattr(self.local, 'profiles', None)
+        if profiles is None:
+            return fn
+
+        def run(*args, **kwargs):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # Đã có profiler khác đang chạy (3.12+ profile mọi thread cùng lúc)
+                return fn(*args, **kwargs)
+            self.local.profiles = profiles
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                self.local.profiles = None
+                profiles.append(prof)
+        return run
+
+    def save(self, route, profiles, elapsed):
+        try:
+            stats = pstats.Stats(profiles[0])
+            for prof in profiles[1:]:
+                stats.add(prof)
+        except (TypeError, ValueError):
+            return
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{route.replace('/', '_')}-{int(elapsed * 1000)}ms.prof"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(os.path.join(self.directory, name))
+            files = sorted(f for f in os.listdir(self.directory) if f.endswith('.prof'))
+            for old in files[:-self.keep]:
+                os.remove(os.path.join(self.directory, old))
+        except OSError as e:
+            if self.log is not None:
+                self.log('Lỗi lưu profile', dir=self.directory, error=str(e))
+            name = None
+
+        with self.lock:
+            for func, (_, calls, tottime, cumtime, _) in stats.stats.items():
+                total = self.totals.setdefault(func, [0, 0.0, 0.0])
+                total[0] += calls
+                total[1] += tottime
+                total[2] += cumtime
+            self.routes[route] += 1
+            self.recent = (self.recent + [(name, route, round(elapsed * 1000, 1))])[-20:]
+        if self.metrics is not None:
+            self.metrics.inc('profiled_requests_total', (('route', route),))
+
+    def summary(self, sort='tottime'):
+        index = 2 if sort == 'cumtime' else 1
+        with self.lock:
+            hot = sorted(self.totals.items(), key=lambda item: item[1][index], reverse=True)[:self.top]
+            return {
+                "sampleRate": self.sample,
+                "dir": self.directory,
+                "routes": dict(self.routes),
+                "recent": [{"file": f, "route": r, "ms": ms} for f, r, ms in reversed(self.recent)],
+                "sort": 'cumtime' if index == 2 else 'tottime',
+                "top": [{
+                    "function": f"{os.path.basename(file)}:{line}({func})" if line else func,
+                    "calls": calls,
+                    "tottime": round(tottime, 4),
+                    "cumtime": round(cumtime, 4),
+                } for (file, line, func), (calls, tottime, cumtime) in hot],
+            }
@@ -0,0 +1,101 @@
+"""Server-Timing cho API của server.py: cộng dồn thời gian theo phase trong lúc xử lý request.
+
+Phase lồng nhau chỉ tính phần riêng (vd: cache miss không gồm thời gian gọi upstream bên trong).
+"""
+import functools
+import threading
+import time
+from collections import defaultdict
+
+TIMING_PHASES = ('startup', 'cache', 'upstream', 'dataframe', 'json', 'write')
+_TIMING = threading.local()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases = defaultdict(float)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.phases[name] += seconds
+
+    def snapshot(self):
+        # Thời gian (ms) theo phase, cùng tổng thời gian từ đầu request tới lúc gọi
+        with self.lock:
+            phases = dict(self.phases)
+        data = {name: round(phases[name] * 1000, 2) for name in TIMING_PHASES if name in phases}
+        data['total'] = round((time.perf_counter() - self.started) * 1000, 2)
+        return data
+
+    def header(self):
+        return ', '.join(f'{name};dur={ms}' for name, ms in self.snapshot().items())
+
+
+class _Phase:
+    # Context manager/decorator nhẹ: nằm trên đường nóng của mọi request API
+    __slots__ = ('name', 'timings', 'frame', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = getattr(_TIMING, 'timings', None)
+        if self.timings is not None:
+            self.frame = [0.0]   # thời gian của các phase con
+            _TIMING.stack.append(self.frame)
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timings is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        stack = _TIMING.stack
+        stack.pop()
+        self.timings.add(self.name, elapsed - self.frame[0])
+        if stack:
+            stack[-1][0] += elapsed
+
+    def __call__(self, fn):
+        name = self.name
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            if getattr(_TIMING, 'timings', None) is None:
+                return fn(*args, **kwargs)
+            with _Phase(name):
+                return fn(*args, **kwargs)
+        return run
+
+
+def timed(name):
+    return _Phase(name)
+
+
+def begin_request():
+    # Bắt đầu đo cho request API trên thread hiện tại
+    timings = _TIMING.timings = RequestTimings()
+    _TIMING.stack = []
+    return timings
+
+
+def end_request():
+    _TIMING.timings = None
+
+
+def bind_timing(fn):
+    # Cho việc chạy ở thread khác mà request đang chờ đồng bộ (vd: call_with_deadline)
+    # ghi phase vào cùng request, lồng dưới phase hiện tại
+    timings = getattr(_TIMING, 'timings', None)
+    if timings is None:
+        return fn
+    parent = _TIMING.stack[-1] if _TIMING.stack else [0.0]
+
+    def run(*args, **kwargs):
+        _TIMING.timings, _TIMING.stack = timings, [parent]
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _TIMING.timings = None
+    return run
@@ -6,6 +6,9 @@ import json
 import random
 import sys
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
 
 # Thêm đường dẫn cài đặt thư viện vào sys.path
@@ -33,6 +36,31 @@ BASE_PRICES = {
     'TCB': 34.2, 'VCB': 91.0, 'HPG': 28.5, 'MWG': 45.3
 }
 
+# Hạn chót cho mỗi lần gọi vnstock, quá hạn thì dùng dữ liệu giả lập.
+# Worker bị treo vẫn giữ slot nên số call treo không vượt MARKET_WORKERS
+MARKET_TIMEOUT = float(os.environ.get('MARKET_TIMEOUT', 8))
+MARKET_WORKERS = int(os.environ.get('MARKET_WORKERS', 4))
+MARKET_EXECUTOR = ThreadPoolExecutor(max_workers=MARKET_WORKERS, thread_name_prefix='market')
+MARKET_SLOTS = threading.BoundedSemaphore(MARKET_WORKERS)
+
+
+def call_with_deadline(fn, timeout=MARKET_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    if not MARKET_SLOTS.acquire(timeout=timeout):
+        raise TimeoutError(f"không còn worker trống sau {timeout}s")
+
+    def run():
+        try:
+            return fn()
+        finally:
+            MARKET_SLOTS.release()
+
+    future = MARKET_EXECUTOR.submit(run)
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise TimeoutError(f"quá thời gian {timeout}s") from None
+
 class StockHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
         if self.path.startswith("/api/"):
@@ -52,7 +80,11 @@ class StockHandler(http.server.SimpleHTTPRequestHandler):
 
             elif parsed_path.path == "/api/history":
                 ticker = query_params.get('ticker', [''])[0]
-                data = self.get_history(ticker)
+                try:
+                    count = max(1, min(int(query_params.get('count', [100])[0]), 5000))
+                except ValueError:
+                    count = 100
+                data = self.get_history(ticker, count)
                 self.send_json(data)
 
             elif parsed_path.path == "/api/stats":
@@ -71,8 +103,7 @@ class StockHandler(http.server.SimpleHTTPRequestHandler):
             for t in tickers.split(','):
                 try:
                     # Sử dụng VCI làm provider thay cho TCBS bị deprecated
-                    q = Quote(symbol=t, source='VCI')
-                    df = q.history(count_back=2) # Lấy 2 phiên để có giá đóng cửa cũ tính % thay đổi
+                    df = call_with_deadline(lambda t=t: Quote(symbol=t, source='VCI').history(count_back=2)) # Lấy 2 phiên để có giá đóng cửa cũ tính % thay đổi
                     if not df.empty:
                         last = df.iloc[-1]
                         prev = df.iloc[-2] if len(df) > 1 else last
@@ -107,26 +138,23 @@ class StockHandler(http.server.SimpleHTTPRequestHandler):
             })
         return {"data": results, "source": "giả lập (fallback)"}
 
-    def get_history(self, ticker):
+    def get_history(self, ticker, count=100):
         if VNSTOCK_AVAILABLE:
             try:
-                q = Quote(symbol=ticker, source='VCI')
-                df = q.history(count_back=100)
+                df = call_with_deadline(lambda: Quote(symbol=ticker, source='VCI').history(count_back=count))
 
-                data = []
                 # Vnstock v3 thường dùng cột 'time' hoặc 'TradingDate'
                 time_col = 'time' if 'time' in df.columns else (df.index.name if df.index.name else 'time')
 
-                if time_col not in df.columns and time_col != df.index.name:
+                if time_col not in df.columns:
                     # Nếu là index
                     df = df.reset_index()
-                    time_col = 'time' if 'time' in df.columns else df.columns[0]
+                    time_col = time_col if time_col in df.columns else df.columns[0]
 
-                for _, row in df.iterrows():
-                    data.append({
-                        "tradingDate": str(row[time_col]),
-                        "close": float(row['close']) * 1000
-                    })
+                # Xử lý theo cột thay vì iterrows: nhân giá và format ngày cho cả cột
+                dates = df[time_col].astype(str).tolist()
+                closes = (df['close'].astype(float) * 1000).tolist()
+                data = [{"tradingDate": d, "close": c} for d, c in zip(dates, closes)]
                 return {"data": data, "source": "vnstock (VCI)"}
             except Exception as e:
                 print(f"Lỗi lịch sử cho {ticker}: {e}")
@@ -136,8 +164,8 @@ class StockHandler(http.server.SimpleHTTPRequestHandler):
         base = BASE_PRICES.get(ticker, 50.0)
         curr = base
         now = datetime.now()
-        for i in range(100):
-            d = now - timedelta(days=i)
+        d = now
+        while len(data) < count:
             if d.weekday() < 5:
                 change = random.uniform(-0.03, 0.03)
                 curr = curr * (1 + change)
@@ -145,13 +173,13 @@ class StockHandler(http.server.SimpleHTTPRequestHandler):
                     "tradingDate": d.strftime("%Y-%m-%dT00:00:00Z"),
                     "close": curr * 1000
                 })
+            d -= timedelta(days=1)
         return {"data": data, "source": "giả lập"}
 
     def get_stats(self, ticker):
         if VNSTOCK_AVAILABLE:
             try:
-                f = Finance(symbol=ticker, source='VCI')
-                df = f.ratio(period='year') # Thường lấy theo năm
+                df = call_with_deadline(lambda: Finance(symbol=ticker, source='VCI').ratio(period='year')) # Thường lấy theo năm
                 if not df.empty:
                     # Lấy dòng mới nhất
                     latest = df.iloc[-1]
@@ -0,0 +1,227 @@
+"""Phần dùng chung của các proxy tìm kiếm YouTube (server.py và kid_video/proxy_youtube_api.py):
+chuẩn hoá query, cache kết quả (LRU + TTL) và pool kết nối keep-alive tới upstream.
+"""
+import atexit
+import gzip
+import http.client
+import json
+import os
+import select
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+
+def print_log(message, **fields):
+    # Log mặc định khi không truyền log=: in ra stdout như các script nhỏ trong repo
+    print(message + ''.join(f' {k}={v}' for k, v in fields.items()))
+
+
+def normalize_query(query):
+    # "  Baby   SHARK " và "baby shark" dùng chung một entry
+    return ' '.join(query.casefold().split())
+
+
+class SearchCache:
+    """LRU có TTL cho kết quả tìm kiếm, định dạng file giống search_cache.json của kid_video/server."""
+
+    def __init__(self, max_entries, ttl, path=None, log=print_log):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.log = log
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> {'data': ..., 'timestamp': ms}
+        self.save_timer = None
+        self.save_lock = threading.Lock()
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time() * 1000
+        fresh = [(k, v) for k, v in saved.items() if now - v.get('timestamp', 0) < self.ttl * 1000]
+        fresh.sort(key=lambda kv: kv[1]['timestamp'])
+        self.entries.update(fresh[-self.max_entries:])
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            snapshot = dict(self.entries)
+        with self.save_lock:
+            try:
+                tmp = self.path + '.tmp'
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                self.log('Lỗi lưu cache YouTube', error=str(e))
+
+    def flush(self):
+        # Lúc thoát: lưu nốt thay đổi còn chờ timer
+        if self.save_timer is not None:
+            self.save_timer.cancel()
+            self.save()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() * 1000 - entry['timestamp'] >= self.ttl * 1000:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry['data']
+
+    def put(self, key, data):
+        with self.lock:
+            self.entries[key] = {'data': data, 'timestamp': int(time.time() * 1000)}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            # Không ghi file trên đường request: hẹn lưu sau 1s, gộp các lần put liền nhau
+            if self.path and self.save_timer is None:
+                self.save_timer = threading.Timer(1.0, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+
+class PooledHTTPSConnection(http.client.HTTPSConnection):
+    # Dùng lại TLS session của pool để handshake các kết nối mới nhanh hơn
+    tls_session = None
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host, session=self.tls_session)
+
+
+class UpstreamPool:
+    """Pool kết nối HTTPS có giới hạn tới một host, tự kiểm tra và thay kết nối cũ."""
+
+    def __init__(self, host, size, timeout, max_age=300, max_idle=60, secure=True, log=print_log):
+        self.host = host
+        self.secure = secure
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.log = log
+        self.context = ssl.create_default_context()
+        self.session = None
+        self.lock = threading.Lock()
+        self.idle = []   # [(conn, created_at, last_used)]
+        self.slots = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        if self.secure:
+            conn = PooledHTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+            conn.tls_session = self.session
+        else:
+            conn = http.client.HTTPConnection(self.host, timeout=self.timeout)
+        conn.connect()
+        return conn, time.monotonic()
+
+    def healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if conn.sock is None or now - created_at > self.max_age or now - last_used > self.max_idle:
+            return False
+        return self.drain(conn, 0)
+
+    def drain(self, conn, wait):
+        # Socket rảnh mà đọc được: với TLS 1.3 thường chỉ là NewSessionTicket server gửi sau handshake,
+        # đọc thử không chặn để OpenSSL xử lý ticket; có dữ liệu thật hoặc EOF thì kết nối hỏng
+        tls = isinstance(conn.sock, ssl.SSLSocket)
+        try:
+            if tls and conn.sock.pending():
+                return False
+            readable, _, _ = select.select([conn.sock], [], [], wait)
+        except (OSError, ValueError):
+            return False
+        if not readable:
+            return True
+        if not tls:
+            return False
+        conn.sock.setblocking(False)
+        try:
+            conn.sock.recv(1)
+            return False
+        except ssl.SSLWantReadError:
+            return True
+        except OSError:
+            return False
+        finally:
+            conn.sock.settimeout(self.timeout)
+
+    def save_session(self, conn):
+        if conn.sock is not None and getattr(conn.sock, 'session', None) is not None:
+            self.session = conn.sock.session
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f'Hết kết nối tới {self.host}')
+        try:
+            with self.lock:
+                while self.idle:
+                    conn, created_at, last_used = self.idle.pop()
+                    if self.healthy(conn, created_at, last_used):
+                        return conn, created_at, True
+                    conn.close()
+            return (*self.connect(), False)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, created_at, reusable):
+        try:
+            self.save_session(conn)
+            if reusable:
+                with self.lock:
+                    self.idle.append((conn, created_at, time.monotonic()))
+            else:
+                conn.close()
+        finally:
+            self.slots.release()
+
+    def request(self, method, path, body=None, headers=None):
+        # Trả về (status, body). Kết nối cũ bị server đóng thì thử lại 1 lần bằng kết nối mới
+        for attempt in range(2):
+            conn, created_at, reused = self.acquire()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+                if response.getheader('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.release(conn, created_at, False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                self.release(conn, created_at, False)
+                raise
+            self.release(conn, created_at, not response.will_close)
+            return response.status, data
+
+    def warm_up(self, count=1):
+        # Mở sẵn kết nối khi server khởi động để lần tìm đầu tiên không phải chờ handshake
+        for _ in range(count):
+            try:
+                conn, created_at = self.connect()
+                # Chờ ticket TLS 1.3 để lưu session cho các kết nối mới sau này
+                if self.secure and not self.drain(conn, 0.5):
+                    conn.close()
+                    continue
+                self.save_session(conn)
+                with self.lock:
+                    self.idle.append((conn, created_at, time.monotonic()))
+            except OSError as e:
+                self.log('Không warm-up được kết nối', host=self.host, error=str(e))
+                return